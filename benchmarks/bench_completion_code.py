@@ -0,0 +1,101 @@
+"""
+Microbenchmark of get_completion_code on realistic MTurk Answer payloads,
+comparing the incremental parser with the previous implementation
+(ElementTree.fromstring on the whole document).
+
+python -m benchmarks.bench_completion_code [repeat]
+"""
+
+import json
+import os
+import sys
+import timeit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hrproj.settings')
+import django
+
+django.setup()
+
+from mturk.utils import get_completion_code
+
+NAMESPACE = (
+    'http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/'
+    '2005-10-01/QuestionFormAnswers.xsd'
+)
+
+
+def legacy_get_completion_code(xml: str) -> str:
+    if not xml:
+        return ''
+    root = ElementTree.fromstring(xml)
+    for ans in root:
+        if ans[0].text == 'taskAnswers':
+            answer_data = json.loads(ans[1].text)
+            try:
+                return answer_data[0]['completion_code']
+            except:
+                return ''
+    return ''
+
+
+def make_answer_xml(answers: dict) -> str:
+    parts = [f'<?xml version="1.0" encoding="ASCII"?><QuestionFormAnswers xmlns="{NAMESPACE}">']
+    for identifier, text in answers.items():
+        parts.append(
+            f'<Answer><QuestionIdentifier>{identifier}</QuestionIdentifier>'
+            f'<FreeText>{escape(text)}</FreeText></Answer>'
+        )
+    parts.append('</QuestionFormAnswers>')
+    return ''.join(parts)
+
+
+def make_payloads():
+    feedback = 'The study was interesting but the second part was long. ' * 40
+    return {
+        # what our default HIT template (crowd-form with one field) submits
+        'crowd-form, code only': make_answer_xml(
+            {'taskAnswers': json.dumps([{'completion_code': 'A1B2C3D4'}])}
+        ),
+        # crowd-form with a survey of free-text questions
+        'crowd-form, 30 fields': make_answer_xml(
+            {
+                'taskAnswers': json.dumps(
+                    [
+                        {
+                            'completion_code': 'A1B2C3D4',
+                            **{f'q{i}': feedback[:200] for i in range(30)},
+                        }
+                    ]
+                )
+            }
+        ),
+        # crowd-form first, followed by other answers (e.g. an uploaded text file)
+        'taskAnswers then 50 others': make_answer_xml(
+            {
+                'taskAnswers': json.dumps([{'completion_code': 'A1B2C3D4'}]),
+                **{f'comment{i}': feedback for i in range(50)},
+            }
+        ),
+        # a plain HTML form, which doesn't have taskAnswers
+        'plain form, 50 fields': make_answer_xml(
+            {f'field{i}': feedback for i in range(50)}
+        ),
+    }
+
+
+def main(repeat=2000):
+    print(f'{repeat} calls per payload, microseconds per call')
+    for name, xml in make_payloads().items():
+        assert get_completion_code(xml) == legacy_get_completion_code(xml), name
+        before = timeit.timeit(lambda: legacy_get_completion_code(xml), number=repeat)
+        after = timeit.timeit(lambda: get_completion_code(xml), number=repeat)
+        print(
+            f'{name:>28} ({len(xml) // 1024:>3} KB): '
+            f'before {1e6 * before / repeat:8.1f}, after {1e6 * after / repeat:8.1f}'
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
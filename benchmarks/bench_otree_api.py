@@ -0,0 +1,86 @@
+"""
+Per-call latency of otree_api.call_api against a local fake oTree server,
+comparing a fresh connection per call (the old behavior) with the pooled transport.
+On localhost a new connection is almost free, so it's run a second time
+with a simulated round trip of latency_ms, where a new connection also pays
+for the TCP and TLS handshakes (see fake_otree.Handler), like a real site.
+
+python -m benchmarks.bench_otree_api [num_calls] [num_participants] [latency_ms]
+"""
+
+import statistics
+import sys
+import time
+
+import requests
+
+import otree_api
+from otree_api import GET, call_api
+from .fake_otree import REST_KEY, start_server, server_url
+
+
+def call_api_unpooled(site_url, rest_key, *path_parts, **params):
+    '''what call_api used to do: module-level requests.get, no keep-alive'''
+    url = site_url + '/api/' + '/'.join(path_parts)
+    resp = requests.get(
+        url,
+        json=params,
+        headers={'otree-rest-key': rest_key, 'Connection': 'close'},
+    )
+    resp.raise_for_status()
+    return resp.json()
+
+
+def timeit(func, num_calls):
+    latencies = []
+    for _ in range(num_calls):
+        start = time.perf_counter()
+        func()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return dict(
+        mean=statistics.mean(latencies),
+        p50=latencies[len(latencies) // 2],
+        p95=latencies[int(len(latencies) * 0.95) - 1],
+    )
+
+
+def compare(num_calls, num_participants, latency_ms):
+    server = start_server(num_participants=num_participants, latency_ms=latency_ms)
+    url = server_url(server)
+    labels = [f'W{i:05}' for i in range(0, num_participants, 2)]
+
+    results = dict(
+        unpooled=timeit(
+            lambda: call_api_unpooled(
+                url, REST_KEY, 'sessions', 'abc', participant_labels=labels
+            ),
+            num_calls,
+        ),
+        pooled=timeit(
+            lambda: call_api(url, REST_KEY, GET, 'sessions', 'abc', participant_labels=labels),
+            num_calls,
+        ),
+    )
+    otree_api.close_http_session(url)
+    server.shutdown()
+
+    print(
+        f'{num_calls} calls, {num_participants} participants in session, '
+        f'{latency_ms} ms round trip'
+    )
+    for name, stats in results.items():
+        print(
+            f'{name:>10}: mean {stats["mean"]:.2f} ms, '
+            f'p50 {stats["p50"]:.2f} ms, p95 {stats["p95"]:.2f} ms'
+        )
+
+
+def main(num_calls=300, num_participants=500, latency_ms=20):
+    compare(num_calls, num_participants, latency_ms=0)
+    # every call waits for the network here, so fewer of them
+    compare(max(num_calls // 10, 20), num_participants, latency_ms=latency_ms)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,123 @@
+"""
+Redirects per second for RedirectMTurk and RedirectProlific,
+comparing the cached fast path with the previous implementation
+(Session.get_or_404 + get_or_create on every click).
+
+python -m benchmarks.bench_redirects [num_workers] [clicks_per_worker]
+"""
+
+import sys
+import time
+
+from .django_setup import setup_django_with_test_db
+
+setup_django_with_test_db()
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.http import HttpResponse, HttpResponseRedirect
+from django.test import RequestFactory
+
+from hr.models import Site
+import mturk.models
+import mturk.views
+import prolific.models
+import prolific.views
+
+
+def legacy_redirect_mturk(request, id):
+    session = mturk.models.Session.get_or_404(id=id)
+    assignment_id = request.GET['assignmentId']
+    worker_id = request.GET['workerId']
+    worker, _ = mturk.models.HITWorker.objects.get_or_create(
+        worker_id=worker_id,
+        session=session,
+        defaults=dict(assignment_id=assignment_id),
+    )
+    if worker.assignment_id != assignment_id:
+        return HttpResponse("Please return the assignment.")
+    return HttpResponseRedirect(
+        session.session_wide_url + '?participant_label=' + worker_id
+    )
+
+
+def legacy_redirect_prolific(request, id):
+    session = prolific.models.Session.get_or_404(id=id)
+    prolific_pid = request.GET['PROLIFIC_PID']
+    prolific.models.Worker.objects.get_or_create(
+        prolific_pid=prolific_pid,
+        study_id=request.GET['STUDY_ID'],
+        prolific_sid=request.GET['SESSION_ID'],
+        session=session,
+    )
+    return HttpResponseRedirect(
+        session.session_wide_url + '?participant_label=' + prolific_pid
+    )
+
+
+def make_sessions():
+    user = User.objects.create(username='bench@example.com')
+    site = Site.objects.create(url='http://localhost:8000', profile=user.profile)
+    fields = dict(
+        site=site,
+        code='bench',
+        session_wide_url='http://localhost:8000/join/bench',
+        admin_url='http://localhost:8000/SessionStartLinks/bench',
+        num_participants=1000,
+    )
+    return (
+        mturk.models.Session.objects.create(**fields),
+        prolific.models.Session.objects.create(**fields),
+    )
+
+
+def run(view, session_id, make_params, num_workers, clicks_per_worker):
+    factory = RequestFactory()
+    requests = [
+        factory.get('/', make_params(i))
+        for _ in range(clicks_per_worker)
+        for i in range(num_workers)
+    ]
+    num_queries = 0
+
+    def count_queries(execute, *args):
+        nonlocal num_queries
+        num_queries += 1
+        return execute(*args)
+
+    with connection.execute_wrapper(count_queries):
+        start = time.perf_counter()
+        for request in requests:
+            response = view(request, id=session_id)
+            assert response.status_code == 302, response
+        elapsed = time.perf_counter() - start
+    return len(requests) / elapsed, num_queries / len(requests)
+
+
+def main(num_workers=500, clicks_per_worker=3):
+    mturk_session, prolific_session = make_sessions()
+
+    def mturk_params(i):
+        return dict(workerId=f'W{i}', assignmentId=f'A{i}', hitId='H')
+
+    def prolific_params(i):
+        return dict(PROLIFIC_PID=f'P{i}', STUDY_ID='S', SESSION_ID=f'SID{i}')
+
+    cases = [
+        ('mturk', 'before', legacy_redirect_mturk, mturk_session, mturk_params),
+        ('mturk', 'after', mturk.views.RedirectMTurk.as_view(), mturk_session, mturk_params),
+        ('prolific', 'before', legacy_redirect_prolific, prolific_session, prolific_params),
+        ('prolific', 'after', prolific.views.RedirectProlific.as_view(), prolific_session, prolific_params),
+    ]
+    print(f'{num_workers} workers, {clicks_per_worker} clicks each')
+    for platform, label, view, session, make_params in cases:
+        # each case starts with no workers recorded, so that the first click
+        # of each worker does the insert.
+        mturk.models.HITWorker.objects.all().delete()
+        prolific.models.Worker.objects.all().delete()
+        rate, queries = run(view, session.id, make_params, num_workers, clicks_per_worker)
+        print(f'{platform:>8} {label:>6}: {rate:8.0f} redirects/s, {queries:.2f} queries/redirect')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
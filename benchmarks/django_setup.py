@@ -0,0 +1,22 @@
+import os
+
+
+def setup_django_with_test_db():
+    """configures Django and creates a throwaway test database.
+    tables are created directly from the models (like --nomigrations),
+    since benchmarks don't need the migration history.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'hrproj.settings')
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.ALLOWED_HOSTS = ['*']
+    settings.MIGRATION_MODULES = {
+        app_config.label: None for app_config in django.apps.apps.get_app_configs()
+    }
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
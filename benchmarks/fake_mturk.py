@@ -0,0 +1,266 @@
+"""
+A stand-in for the MTurk requester API, for benchmarks and load tests.
+It speaks the same JSON protocol as the real endpoint, so boto3 can talk to it.
+Point oTree HR at it with the MTURK_ENDPOINT_URL env var
+(any AWS keys will do, since requests aren't authenticated).
+It implements only the operations that oTree HR uses, and keeps its state in memory.
+
+python -m benchmarks.fake_mturk 8002 [latency_ms]
+"""
+
+import json
+import random
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+TARGET_PREFIX = 'MTurkRequesterServiceV20170117.'
+
+
+class FakeMTurkError(Exception):
+    def __init__(self, code, message=''):
+        self.code = code
+        self.message = message
+
+
+class FakeMTurkState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.hits = {}
+        self.hit_ids_by_token = {}
+        # UniqueRequestTokens of operations other than CreateHIT
+        self.used_tokens = set()
+        # hit_id -> list of assignment dicts
+        self.assignments = {}
+        self.bonuses = []
+        self.num_assignments = 0
+        self.num_calls = 0
+
+    def add_assignments(
+        self, hit_id, worker_ids, status='Submitted', completion_code='ABC123'
+    ):
+        """simulates workers submitting the HIT"""
+        answer = (
+            '<?xml version="1.0" encoding="ASCII"?><QuestionFormAnswers '
+            'xmlns="http://mechanicalturk.amazonaws.com/AWSMechanicalTurkDataSchemas/'
+            '2005-10-01/QuestionFormAnswers.xsd"><Answer>'
+            '<QuestionIdentifier>taskAnswers</QuestionIdentifier><FreeText>'
+            '[{&quot;completion_code&quot;:&quot;%s&quot;}]'
+            '</FreeText></Answer></QuestionFormAnswers>' % completion_code
+        )
+        with self.lock:
+            lst = self.assignments.setdefault(hit_id, [])
+            for worker_id in worker_ids:
+                self.num_assignments += 1
+                lst.append(
+                    dict(
+                        AssignmentId=f'FAKEASSIGNMENT{self.num_assignments:016}',
+                        WorkerId=worker_id,
+                        HITId=hit_id,
+                        AssignmentStatus=status,
+                        AcceptTime=time.time() - 60,
+                        SubmitTime=time.time(),
+                        Answer=answer,
+                    )
+                )
+
+    def _find_assignment(self, assignment_id):
+        for lst in self.assignments.values():
+            for a in lst:
+                if a['AssignmentId'] == assignment_id:
+                    return a
+        raise FakeMTurkError(
+            'RequestError', f'Assignment {assignment_id} does not exist.'
+        )
+
+    def _get_hit(self, hit_id):
+        try:
+            return self.hits[hit_id]
+        except KeyError:
+            raise FakeMTurkError('RequestError', f'Hit {hit_id} does not exist.')
+
+    # operations. the names match the X-Amz-Target header.
+
+    def CreateHIT(self, p):
+        token = p.get('UniqueRequestToken')
+        if token in self.hit_ids_by_token:
+            # like MTurk, the message has the ID of the HIT made with the token
+            raise FakeMTurkError(
+                'RequestError',
+                f'The request token {token} has already been used. '
+                f'HITId: {self.hit_ids_by_token[token]} '
+                '(AWS.MechanicalTurk.HitAlreadyExists)',
+            )
+        hit_id = f'FAKEHIT{len(self.hits):023}'
+        hit = dict(
+            HITId=hit_id,
+            HITTypeId='FAKEHITTYPE',
+            # the real HITGroupId depends on the properties of the HIT
+            HITGroupId='FAKEGROUP' + str(abs(hash(p['Title'])) % 10 ** 9),
+            CreationTime=time.time(),
+            Title=p['Title'],
+            Description=p.get('Description', ''),
+            Question=p['Question'],
+            Keywords=p.get('Keywords', ''),
+            HITStatus='Assignable',
+            MaxAssignments=p['MaxAssignments'],
+            Reward=p['Reward'],
+            Expiration=time.time() + p['LifetimeInSeconds'],
+            AssignmentDurationInSeconds=p['AssignmentDurationInSeconds'],
+            RequesterAnnotation=p.get('RequesterAnnotation', ''),
+        )
+        self.hits[hit_id] = hit
+        if token:
+            self.hit_ids_by_token[token] = hit_id
+        return dict(HIT=hit)
+
+    def GetHIT(self, p):
+        return dict(HIT=self._get_hit(p['HITId']))
+
+    def ListHITs(self, p):
+        hits = list(self.hits.values())
+        start = int(p.get('NextToken') or 0)
+        page = hits[start : start + p.get('MaxResults', 10)]
+        return dict(HITs=page, NumResults=len(page), NextToken=str(start + len(page)))
+
+    def ListAssignmentsForHIT(self, p):
+        self._get_hit(p['HITId'])
+        statuses = p.get('AssignmentStatuses') or ['Submitted', 'Approved', 'Rejected']
+        matching = [
+            a
+            for a in self.assignments.get(p['HITId'], [])
+            if a['AssignmentStatus'] in statuses
+        ]
+        start = int(p.get('NextToken') or 0)
+        page = matching[start : start + p.get('MaxResults', 10)]
+        return dict(
+            Assignments=page, NumResults=len(page), NextToken=str(start + len(page))
+        )
+
+    def UpdateExpirationForHIT(self, p):
+        self._get_hit(p['HITId'])['Expiration'] = p['ExpireAt']
+        return {}
+
+    def CreateAdditionalAssignmentsForHIT(self, p):
+        hit = self._get_hit(p['HITId'])
+        token = p.get('UniqueRequestToken')
+        if token in self.used_tokens:
+            raise FakeMTurkError(
+                'RequestError', f'The request token {token} has already been used.'
+            )
+        new_max = hit['MaxAssignments'] + p['NumberOfAdditionalAssignments']
+        if hit['MaxAssignments'] < 10 <= new_max:
+            raise FakeMTurkError(
+                'RequestError',
+                'HITs that were created with fewer than 10 assignments '
+                'cannot be extended to have 10 or more assignments.',
+            )
+        hit['MaxAssignments'] = new_max
+        if token:
+            self.used_tokens.add(token)
+        return {}
+
+    def SendBonus(self, p):
+        self._find_assignment(p['AssignmentId'])
+        self.bonuses.append(p)
+        return {}
+
+    def ApproveAssignment(self, p):
+        a = self._find_assignment(p['AssignmentId'])
+        if a['AssignmentStatus'] != 'Submitted':
+            raise FakeMTurkError(
+                'RequestError', 'This operation can be called with a status of: Submitted'
+            )
+        a['AssignmentStatus'] = 'Approved'
+        return {}
+
+    def RejectAssignment(self, p):
+        a = self._find_assignment(p['AssignmentId'])
+        if a['AssignmentStatus'] != 'Submitted':
+            raise FakeMTurkError(
+                'RequestError', 'This operation can be called with a status of: Submitted'
+            )
+        a['AssignmentStatus'] = 'Rejected'
+        return {}
+
+    def GetAccountBalance(self, p):
+        return dict(AvailableBalance='10000.00')
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    state: FakeMTurkState = None
+    # simulated network + processing time of the real API
+    latency = 0.0
+    # fraction of calls that fail with a throttling error
+    throttle_rate = 0.0
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-amz-json-1.1')
+        self.send_header('x-amzn-RequestId', 'fake')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        params = json.loads(self.rfile.read(length) or b'{}')
+        target = self.headers.get('X-Amz-Target', '')
+        operation = target[len(TARGET_PREFIX) :]
+        if self.latency:
+            time.sleep(self.latency)
+        state = self.state
+        with state.lock:
+            state.num_calls += 1
+        if random.random() < self.throttle_rate:
+            return self._send_json(
+                400, {'__type': 'ThrottlingException', 'message': 'Rate exceeded'}
+            )
+        if not re.match(r'^[A-Za-z]+$', operation) or not hasattr(state, operation):
+            return self._send_json(
+                400, {'__type': 'UnknownOperationException', 'message': target}
+            )
+        try:
+            with state.lock:
+                result = getattr(state, operation)(params)
+        except FakeMTurkError as exc:
+            return self._send_json(400, {'__type': exc.code, 'Message': exc.message})
+        return self._send_json(200, result)
+
+
+def start_server(port=0, latency_ms=0, throttle_rate=0.0) -> ThreadingHTTPServer:
+    """starts the server in a daemon thread; port=0 picks a free port.
+    the state is available as server.state
+    """
+    state = FakeMTurkState()
+    handler = type(
+        'Handler',
+        (Handler,),
+        dict(state=state, latency=latency_ms / 1000, throttle_rate=throttle_rate),
+    )
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    server.state = state
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8002
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    server = start_server(port, latency_ms=latency_ms)
+    print(f'Fake MTurk API running at {server_url(server)}')
+    threading.Event().wait()
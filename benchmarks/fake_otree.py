@@ -0,0 +1,138 @@
+"""
+A stand-in for an oTree site's REST API, for benchmarks and load tests.
+It implements only the endpoints that otree_api is used for.
+
+python -m benchmarks.fake_otree 8001 [latency_ms]
+"""
+
+import gzip
+import json
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+REST_KEY = 'fake_rest_key'
+
+
+def make_session_data(code, num_participants, participant_labels=None):
+    participants = [
+        dict(
+            label=f'W{i:05}',
+            code=f'p{i:07}',
+            finished=True,
+            payoff_in_real_world_currency=round(i % 7 * 0.25, 2),
+        )
+        for i in range(num_participants)
+    ]
+    if participant_labels is not None:
+        labels = set(participant_labels)
+        participants = [p for p in participants if p['label'] in labels]
+    return dict(
+        code=code,
+        num_participants=num_participants,
+        config=dict(
+            participation_fee=1.0,
+            mturk_hit_settings=dict(
+                keywords='bonus, study',
+                title='Title for your experiment',
+                description='Description for your experiment',
+                frame_height=500,
+                template='global/mturk_template.html',
+                minutes_allotted_per_assignment=60,
+                expiration_hours=7 * 24,
+                qualification_requirements=[],
+            ),
+        ),
+        session_wide_url=f'http://fake-otree/join/{code}',
+        admin_url=f'http://fake-otree/SessionStartLinks/{code}',
+        mturk_template_html='<p>Fake HIT</p>',
+        participants=participants,
+    )
+
+
+class Handler(BaseHTTPRequestHandler):
+    # so that clients can keep the connection alive
+    protocol_version = 'HTTP/1.1'
+    # otherwise the body waits on the client's delayed ACK of the headers
+    disable_nagle_algorithm = True
+    num_participants = 100
+    # simulated network round trip, in seconds
+    latency = 0.0
+    # a new HTTPS connection costs this many extra round trips:
+    # the TCP handshake, then 2 for a TLS 1.2 handshake
+    HANDSHAKE_ROUND_TRIPS = 3
+
+    def setup(self):
+        super().setup()
+        # called once per connection
+        if self.latency:
+            time.sleep(self.HANDSHAKE_ROUND_TRIPS * self.latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        return json.loads(body) if body else {}
+
+    def _send_json(self, status, data):
+        body = json.dumps(data).encode('utf8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body, compresslevel=5)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        if self.latency:
+            time.sleep(self.latency)
+        params = self._read_json()
+        if self.headers.get('otree-rest-key') != REST_KEY:
+            return self._send_json(403, dict(error='bad rest key'))
+        m = re.match(r'^/api/(sessions|session_vars)/([^/]+)$', self.path)
+        if not m:
+            return self._send_json(404, dict(error='not found'))
+        endpoint, code = m.groups()
+        if endpoint == 'sessions' and self.command == 'GET':
+            data = make_session_data(
+                code, self.num_participants, params.get('participant_labels')
+            )
+            return self._send_json(200, data)
+        if endpoint == 'session_vars' and self.command == 'POST':
+            return self._send_json(200, {})
+        return self._send_json(405, dict(error='method not allowed'))
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+def start_server(port=0, num_participants=100, latency_ms=0) -> ThreadingHTTPServer:
+    """starts the server in a daemon thread; port=0 picks a free port."""
+    handler = type(
+        'Handler',
+        (Handler,),
+        dict(num_participants=num_participants, latency=latency_ms / 1000),
+    )
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def server_url(server: ThreadingHTTPServer):
+    host, port = server.server_address[:2]
+    return f'http://{host}:{port}'
+
+
+if __name__ == '__main__':
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+    latency_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 0
+    server = start_server(port, latency_ms=latency_ms)
+    print(f'Fake oTree REST API running at {server_url(server)}, REST key: {REST_KEY}')
+    threading.Event().wait()
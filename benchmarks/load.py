@@ -0,0 +1,392 @@
+"""
+End-to-end load test. Runs oTree HR in a real ASGI server (uvicorn),
+against stand-ins for oTree (benchmarks.fake_otree) and MTurk (benchmarks.fake_mturk),
+with a throwaway database. For each scenario it reports throughput and
+p50/p95/p99 latency.
+
+python -m benchmarks.load [--scenarios redirect_mturk,pay_mturk] [--concurrency 20]
+                          [--requests N] [--participants 200] [--mturk-latency-ms 50]
+
+Scenarios:
+redirect_mturk, redirect_prolific: workers clicking the study link (half are repeat clicks)
+create_hit: publishing sessions, each request publishes a new one
+mturk_payments: loading the payments page of a session
+pay_mturk: paying all workers of a session. the latency is until the payment job is done,
+    so it includes the worker process (python manage.py runworker).
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from . import fake_mturk, fake_otree
+
+SCENARIOS = {}
+
+
+def scenario(default_requests):
+    def register(cls):
+        cls.default_requests = default_requests
+        SCENARIOS[cls.name] = cls
+        return cls
+
+    return register
+
+
+class Scenario:
+    """setup() runs before the clock starts. make_request(i) returns
+    (method, path, data), and is_ok(i, response) checks the response.
+    """
+
+    name = ''
+    expected_status = 302
+    default_requests = 0
+
+    def __init__(self, ctx: 'Context', num_requests):
+        self.ctx = ctx
+        self.num_requests = num_requests
+
+    def setup(self):
+        pass
+
+    def make_request(self, i):
+        raise NotImplementedError
+
+    def is_ok(self, i, response):
+        return response.status_code == self.expected_status
+
+    def teardown(self):
+        pass
+
+
+@scenario(default_requests=2000)
+class RedirectMTurkScenario(Scenario):
+    name = 'redirect_mturk'
+
+    def setup(self):
+        self.session = self.ctx.make_mturk_session('redirect')
+
+    def make_request(self, i):
+        # every worker clicks twice
+        n = i // 2
+        return (
+            'GET',
+            f'/redirect_mturk/{self.session.id}/'
+            f'?workerId=RW{n}&assignmentId=RA{n}&hitId=H',
+            None,
+        )
+
+
+@scenario(default_requests=2000)
+class RedirectProlificScenario(Scenario):
+    name = 'redirect_prolific'
+
+    def setup(self):
+        from prolific.models import Session
+
+        self.session = Session.objects.create(
+            site=self.ctx.site,
+            code='redirect',
+            session_wide_url='http://fake-otree/join/redirect',
+            admin_url='http://fake-otree/SessionStartLinks/redirect',
+            num_participants=self.ctx.num_participants,
+        )
+
+    def make_request(self, i):
+        n = i // 2
+        return (
+            'GET',
+            f'/redirect_prolific/{self.session.id}/'
+            f'?PROLIFIC_PID=PP{n}&STUDY_ID=S&SESSION_ID=PS{n}',
+            None,
+        )
+
+
+@scenario(default_requests=50)
+class CreateHITScenario(Scenario):
+    name = 'create_hit'
+
+    def setup(self):
+        for i in range(self.num_requests):
+            self.ctx.make_mturk_session(f'create{i}')
+
+    def make_request(self, i):
+        return 'POST', f'/CreateHIT/create{i}/', dict(use_sandbox='on')
+
+
+@scenario(default_requests=200)
+class MTurkPaymentsScenario(Scenario):
+    name = 'mturk_payments'
+    expected_status = 200
+
+    def setup(self):
+        self.ctx.make_submitted_session('payments')
+
+    def make_request(self, i):
+        return 'GET', '/MTurkPayments/payments/', None
+
+
+@scenario(default_requests=5)
+class PayMTurkScenario(Scenario):
+    name = 'pay_mturk'
+
+    def setup(self):
+        self.worker_ids = {}
+        for i in range(self.num_requests):
+            code = f'pay{i}'
+            self.worker_ids[code] = self.ctx.make_submitted_session(code)
+        self.runworker = subprocess.Popen(
+            [sys.executable, 'manage.py', 'runworker'], env=os.environ.copy()
+        )
+
+    def make_request(self, i):
+        code = f'pay{i}'
+        return 'POST', f'/PayMTurk/{code}/', dict(workers=self.worker_ids[code])
+
+    def is_ok(self, i, response):
+        from hr.models import Job, job_subject
+        from mturk.models import Session
+
+        if response.status_code != 302:
+            return False
+        subject = job_subject(Session.objects.get(code=f'pay{i}'))
+        while True:
+            job = Job.objects.filter(subject=subject, name='mturk.pay').first()
+            if job and not job.is_active():
+                return job.status == Job.DONE
+            time.sleep(0.05)
+
+    def teardown(self):
+        self.runworker.terminate()
+        self.runworker.wait()
+
+
+class Context:
+    """the servers and the data shared by the scenarios"""
+
+    def __init__(self, args):
+        self.num_participants = args.participants
+        self.tempdir = tempfile.mkdtemp(prefix='hr_load_')
+        self.otree = fake_otree.start_server(num_participants=args.participants)
+        self.mturk = fake_mturk.start_server(latency_ms=args.mturk_latency_ms)
+        os.environ['LOADTEST_DB'] = os.path.join(self.tempdir, 'db.sqlite3')
+        os.environ['MTURK_ENDPOINT_URL'] = fake_mturk.server_url(self.mturk)
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'benchmarks.load_settings'
+
+        import django
+
+        django.setup()
+        from django.core.management import call_command
+        from django.db import connection
+
+        call_command('migrate', verbosity=0)
+        with connection.cursor() as cursor:
+            # so that readers don't wait for writers
+            cursor.execute('PRAGMA journal_mode=WAL')
+        self._make_user()
+        self.server = self._start_hr(args.port)
+        self.base_url = f'http://127.0.0.1:{args.port}'
+        self.cookies = self._login()
+
+    def _make_user(self):
+        from django.contrib.auth.models import User
+        from hr.models import Site
+
+        self.password = 'load-test'
+        user = User.objects.create_user(username='load@example.com', password=self.password)
+        profile = user.profile
+        # the fake endpoint doesn't check them
+        profile.aws_access_key_id = 'FAKEACCESSKEY'
+        profile.aws_secret_access_key = 'FAKESECRET'
+        profile.save()
+        self.user = user
+        self.site = Site.objects.create(
+            url=fake_otree.server_url(self.otree),
+            rest_key=fake_otree.REST_KEY,
+            profile=profile,
+        )
+
+    def _start_hr(self, port):
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                '-m',
+                'uvicorn',
+                'hrproj.asgi:application',
+                '--port',
+                str(port),
+                '--log-level',
+                'warning',
+            ],
+            env=os.environ.copy(),
+        )
+        for _ in range(100):
+            try:
+                requests.get(f'http://127.0.0.1:{port}/accounts/login/')
+                return server
+            except requests.ConnectionError:
+                time.sleep(0.1)
+        server.terminate()
+        raise Exception('oTree HR did not start')
+
+    def _login(self):
+        http = requests.Session()
+        http.get(self.base_url + '/accounts/login/')
+        resp = http.post(
+            self.base_url + '/accounts/login/',
+            data=dict(
+                username=self.user.username,
+                password=self.password,
+                csrfmiddlewaretoken=http.cookies['csrftoken'],
+            ),
+            allow_redirects=False,
+        )
+        assert resp.status_code == 302, 'login failed'
+        return http.cookies
+
+    def http_session(self) -> requests.Session:
+        http = requests.Session()
+        http.cookies.update(self.cookies)
+        http.headers['X-CSRFToken'] = self.cookies['csrftoken']
+        return http
+
+    def make_mturk_session(self, code):
+        from mturk.models import Session
+
+        data = fake_otree.make_session_data(code, self.num_participants, [])
+        return Session.objects.create(
+            site=self.site,
+            code=code,
+            config_json=fake_otree.json.dumps(data['config']),
+            session_wide_url=data['session_wide_url'],
+            admin_url=data['admin_url'],
+            num_participants=self.num_participants,
+            question_template=data['mturk_template_html'],
+        )
+
+    def make_submitted_session(self, code):
+        """a published session where every participant has submitted.
+        returns the worker IDs.
+        """
+        from mturk.models import HIT, HITWorker
+
+        session = self.make_mturk_session(code)
+        http = self.http_session()
+        resp = http.post(
+            f'{self.base_url}/CreateHIT/{code}/',
+            data=dict(use_sandbox='on'),
+            allow_redirects=False,
+        )
+        assert resp.status_code == 302, resp.text[:500]
+        hit_ids = list(HIT.objects.filter(session=session).values_list('hit_id', flat=True))
+        # labels that the fake oTree site knows
+        worker_ids = [f'W{i:05}' for i in range(self.num_participants)]
+        for i, worker_id in enumerate(worker_ids):
+            self.mturk.state.add_assignments(hit_ids[i // 9], [worker_id])
+        assignments = self.mturk.state.assignments
+        HITWorker.objects.bulk_create(
+            [
+                HITWorker(session=session, worker_id=a['WorkerId'], assignment_id=a['AssignmentId'])
+                for hit_id in hit_ids
+                for a in assignments.get(hit_id, [])
+            ]
+        )
+        # copies the assignments to our DB
+        resp = http.get(f'{self.base_url}/MTurkPayments/{code}/')
+        assert resp.status_code == 200, resp.text[:500]
+        return worker_ids
+
+    def close(self):
+        self.server.terminate()
+        self.server.wait()
+        shutil.rmtree(self.tempdir, ignore_errors=True)
+
+
+def percentile(sorted_values, p):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * p))]
+
+
+def run_scenario(ctx: Context, scenario: Scenario, concurrency):
+    local = threading.local()
+
+    def do_request(i):
+        if not hasattr(local, 'http'):
+            local.http = ctx.http_session()
+        method, path, data = scenario.make_request(i)
+        start = time.perf_counter()
+        try:
+            resp = local.http.request(
+                method, ctx.base_url + path, data=data, allow_redirects=False
+            )
+            ok = scenario.is_ok(i, resp)
+        except requests.RequestException:
+            ok = False
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        start = time.perf_counter()
+        results = list(executor.map(do_request, range(scenario.num_requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = sorted(1000 * latency for latency, _ in results)
+    num_errors = sum(1 for _, ok in results if not ok)
+    return dict(
+        requests=len(results),
+        errors=num_errors,
+        throughput=len(results) / elapsed,
+        mean=statistics.mean(latencies),
+        p50=percentile(latencies, 0.50),
+        p95=percentile(latencies, 0.95),
+        p99=percentile(latencies, 0.99),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test oTree HR')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument(
+        '--requests', type=int, help="per scenario (by default, depends on the scenario)"
+    )
+    parser.add_argument('--participants', type=int, default=200)
+    parser.add_argument('--mturk-latency-ms', type=float, default=50)
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args()
+
+    ctx = Context(args)
+    print(
+        f'concurrency {args.concurrency}, {args.participants} participants per session, '
+        f'MTurk latency {args.mturk_latency_ms}ms'
+    )
+    print(
+        f'{"scenario":>18} {"requests":>8} {"errors":>6} {"req/s":>8} '
+        f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}'
+    )
+    try:
+        for name in args.scenarios.split(','):
+            cls = SCENARIOS[name]
+            scenario = cls(ctx, args.requests or cls.default_requests)
+            scenario.setup()
+            try:
+                r = run_scenario(ctx, scenario, args.concurrency)
+            finally:
+                scenario.teardown()
+            print(
+                f'{name:>18} {r["requests"]:>8} {r["errors"]:>6} {r["throughput"]:>8.1f} '
+                f'{r["p50"]:>8.1f} {r["p95"]:>8.1f} {r["p99"]:>8.1f}'
+            )
+    finally:
+        ctx.close()
+
+
+if __name__ == '__main__':
+    main()
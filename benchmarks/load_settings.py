@@ -0,0 +1,20 @@
+"""Settings for benchmarks.load: the project's settings, with a throwaway SQLite DB.
+MTurk calls go to MTURK_ENDPOINT_URL, which benchmarks.load sets.
+"""
+
+from os import environ
+
+from hrproj.settings import *
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': environ['LOADTEST_DB'],
+        # under load, writers wait for each other
+        'OPTIONS': {'timeout': 30},
+    }
+}
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+# so we don't need to run collectstatic
+STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
@@ -0,0 +1,256 @@
+"""
+Checks the number of DB queries of the main views against a budget,
+and that their queries use an index rather than scanning a whole table.
+Each view is run with a small and a large session, so that a query per
+participant (N+1) shows up as the count growing.
+Exits with status 1 if any view is over budget, so it can run in CI.
+
+oTree and MTurk are replaced by benchmarks.fake_otree and benchmarks.fake_mturk.
+
+python -m benchmarks.query_budget [--explain]
+
+--explain prints the SQLite query plan of every query.
+"""
+
+import os
+import sys
+
+from . import fake_mturk, fake_otree
+
+# start before Django reads the settings
+_mturk_server = fake_mturk.start_server()
+os.environ['MTURK_ENDPOINT_URL'] = fake_mturk.server_url(_mturk_server)
+
+from .django_setup import setup_django_with_test_db
+
+setup_django_with_test_db()
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from hr.models import Site
+import mturk.models
+import prolific.models
+
+# max queries per request, including the session and user lookups.
+# if you lower the number of queries of a view, lower its budget too.
+BUDGETS = {
+    'Sites': 4,
+    'MTurkSessions': 5,
+    'ManageHIT': 6,
+    'MTurkPayments': 9,
+    # includes BEGIN and locking the session, while checking for a running payment
+    'PayMTurk': 11,
+    'ProlificPayments': 5,
+    'RedirectMTurk': 2,
+    'RedirectProlific': 2,
+}
+
+SIZES = {'small': 10, 'large': 100}
+
+# tables of our apps. full scans of Django's own tables are not our concern.
+APP_TABLE_PREFIXES = ('hr_', 'mturk_', 'prolific_')
+
+
+class Fixture:
+    """an experimenter with a site per size, each with published sessions"""
+
+    def __init__(self):
+        self.user = User.objects.create_user(
+            username='budget@example.com', password='budget', is_staff=True
+        )
+        profile = self.user.profile
+        profile.aws_access_key_id = 'FAKEACCESSKEY'
+        profile.aws_secret_access_key = 'FAKESECRET'
+        profile.save()
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.sites = {}
+        self.otree_servers = []
+        for size, num_participants in SIZES.items():
+            server = fake_otree.start_server(num_participants=num_participants)
+            self.otree_servers.append(server)
+            self.sites[size] = Site.objects.create(
+                url=fake_otree.server_url(server),
+                rest_key=fake_otree.REST_KEY,
+                profile=profile,
+            )
+
+    def mturk_session(self, size, code, *, published):
+        num_participants = SIZES[size]
+        data = fake_otree.make_session_data(code, num_participants, [])
+        session = mturk.models.Session.objects.create(
+            site=self.sites[size],
+            code=code,
+            config_json=fake_otree.json.dumps(data['config']),
+            session_wide_url=data['session_wide_url'],
+            admin_url=data['admin_url'],
+            num_participants=num_participants,
+            question_template=data['mturk_template_html'],
+        )
+        if published:
+            resp = self.client.post(f'/CreateHIT/{code}/', dict(use_sandbox='on'))
+            assert resp.status_code == 302, resp.content[:500]
+            self._submit_all(session)
+            # the first load copies the assignments from MTurk.
+            # we measure the usual case, where they are already copied.
+            resp = self.client.get(f'/MTurkPayments/{code}/')
+            assert resp.status_code == 200, resp.content[:500]
+        return session
+
+    def _submit_all(self, session):
+        hit_ids = list(
+            mturk.models.HIT.objects.filter(session=session).values_list(
+                'hit_id', flat=True
+            )
+        )
+        state = _mturk_server.state
+        worker_ids = [f'W{i:05}' for i in range(session.num_participants)]
+        for i, worker_id in enumerate(worker_ids):
+            state.add_assignments(hit_ids[i * len(hit_ids) // len(worker_ids)], [worker_id])
+        mturk.models.HITWorker.objects.bulk_create(
+            [
+                mturk.models.HITWorker(
+                    session=session,
+                    worker_id=a['WorkerId'],
+                    assignment_id=a['AssignmentId'],
+                )
+                for hit_id in hit_ids
+                for a in state.assignments[hit_id]
+            ]
+        )
+
+    def prolific_session(self, size, code):
+        num_participants = SIZES[size]
+        session = prolific.models.Session.objects.create(
+            site=self.sites[size],
+            code=code,
+            session_wide_url=f'http://fake-otree/join/{code}',
+            admin_url=f'http://fake-otree/SessionStartLinks/{code}',
+            num_participants=num_participants,
+        )
+        prolific.models.Worker.objects.bulk_create(
+            [
+                prolific.models.Worker(
+                    session=session,
+                    prolific_pid=f'W{i:05}',
+                    study_id='S',
+                    prolific_sid=f'{code}_{i}',
+                )
+                for i in range(num_participants)
+            ]
+        )
+        return session
+
+
+def make_requests(fixture: Fixture, size):
+    """returns {view name: (method, path, data)}"""
+    site = fixture.sites[size]
+    # a few sessions per site, so that the session lists have something to list
+    for i in range(3):
+        fixture.mturk_session(size, f'{size}_unpublished{i}', published=False)
+    manage = fixture.mturk_session(size, f'{size}_manage', published=True)
+    pay = fixture.mturk_session(size, f'{size}_pay', published=True)
+    prolific_session = fixture.prolific_session(size, f'{size}_prolific')
+    return {
+        'Sites': ('GET', '/', None),
+        'MTurkSessions': ('GET', f'/sites/{site.id}/mturk', None),
+        'ManageHIT': ('GET', f'/ManageHIT/{manage.code}/', None),
+        'MTurkPayments': ('GET', f'/MTurkPayments/{manage.code}/', None),
+        'PayMTurk': (
+            'POST',
+            f'/PayMTurk/{pay.code}/',
+            dict(workers=[f'W{i:05}' for i in range(pay.num_participants)]),
+        ),
+        'ProlificPayments': ('GET', f'/ProlificPayments/{prolific_session.code}/', None),
+        # a participant's first click, which is the one that queries
+        'RedirectMTurk': (
+            'GET',
+            f'/redirect_mturk/{manage.id}/?workerId=NEW&assignmentId=NEWA&hitId=H',
+            None,
+        ),
+        'RedirectProlific': (
+            'GET',
+            f'/redirect_prolific/{prolific_session.id}/'
+            f'?PROLIFIC_PID=NEW&STUDY_ID=S&SESSION_ID={size}_NEW',
+            None,
+        ),
+    }
+
+
+def get_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def full_scans(plan):
+    """e.g. 'SCAN mturk_hitworker', as opposed to 'SEARCH ... USING INDEX'"""
+    return [
+        line
+        for line in plan
+        if line.startswith('SCAN ')
+        and line.split()[1].startswith(APP_TABLE_PREFIXES)
+    ]
+
+
+def measure(client: Client, method, path, data):
+    caches['redirects'].clear()
+    caches['otree_api'].clear()
+    with CaptureQueriesContext(connection) as ctx:
+        if method == 'GET':
+            resp = client.get(path)
+        else:
+            resp = client.post(path, data)
+    assert resp.status_code in [200, 302], (path, resp.status_code)
+    queries = []
+    for query in ctx.captured_queries:
+        sql = query['sql']
+        plan = get_plan(sql) if sql.lstrip().upper().startswith('SELECT') else []
+        queries.append((sql, plan))
+    return queries
+
+
+def main():
+    explain = '--explain' in sys.argv
+    fixture = Fixture()
+    requests_by_size = {size: make_requests(fixture, size) for size in SIZES}
+
+    failures = []
+    print(f'{"view":>18} {"small":>6} {"large":>6} {"budget":>6}  problems')
+    for view, budget in BUDGETS.items():
+        counts = {}
+        problems = []
+        for size, requests in requests_by_size.items():
+            queries = measure(fixture.client, *requests[view])
+            counts[size] = len(queries)
+            for sql, plan in queries:
+                scans = full_scans(plan)
+                if scans:
+                    problems.append(f'{", ".join(scans)} in: {sql[:200]}')
+                if explain:
+                    print(f'\n[{view} {size}] {sql}')
+                    for line in plan:
+                        print(f'    {line}')
+        if max(counts.values()) > budget:
+            problems.append('over budget')
+        if counts['large'] > counts['small']:
+            problems.append('more queries with more participants')
+        print(
+            f'{view:>18} {counts["small"]:>6} {counts["large"]:>6} {budget:>6}  '
+            + '; '.join(sorted(set(problems)))
+        )
+        if problems:
+            failures.append(view)
+    for server in fixture.otree_servers + [_mturk_server]:
+        server.shutdown()
+    if failures:
+        print(f'\nFailed: {", ".join(failures)}')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,7 +1,8 @@
 from django.contrib import admin
+from django.utils.html import format_html
 
 # Register your models here.
-from hr.models import Site, Profile
+from hr.models import Site, Profile, Job, RequestProfile
 
 
 @admin.register(Site)
@@ -15,3 +16,56 @@ class SiteAdmin(admin.ModelAdmin):
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
     list_display = ['id', 'user']
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'name', 'description', 'status', 'created', 'finished']
+    list_filter = ['status', 'name']
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = [
+        'created',
+        'method',
+        'path',
+        'view',
+        'session_code',
+        'status_code',
+        'duration_ms',
+        'num_queries',
+        'trigger',
+    ]
+    list_filter = ['created', 'view', 'trigger']
+    search_fields = ['path', 'session_code']
+    # the slowest first. filter by 'created' for recent ones.
+    ordering = ['-duration_ms']
+    fields = readonly_fields = [
+        'created',
+        'method',
+        'path',
+        'view',
+        'session_code',
+        'status_code',
+        'duration_ms',
+        'num_queries',
+        'trigger',
+        'summary_pre',
+        'stacks_pre',
+    ]
+
+    def has_add_permission(self, request):
+        return False
+
+    # keep the column alignment and line breaks
+
+    def summary_pre(self, obj):
+        return format_html('<pre>{}</pre>', obj.summary)
+
+    summary_pre.short_description = 'summary'
+
+    def stacks_pre(self, obj):
+        return format_html('<pre>{}</pre>', obj.stacks)
+
+    stacks_pre.short_description = 'stacks'
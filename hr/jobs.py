@@ -0,0 +1,220 @@
+"""
+A minimal background job queue stored in the DB (the Job model),
+so that we don't need a broker like Redis.
+
+Register a handler:
+
+    @job_handler('mturk.pay')
+    def pay(job: Job, **args): ...
+
+enqueue it from a view with enqueue('mturk.pay', ...),
+and run the worker with: python manage.py runworker
+
+Jobs of a worker that died are retried, so handlers must be safe to re-run
+(e.g. by using MTurk's UniqueRequestToken).
+
+Housekeeping that should happen on a schedule rather than in a request
+is registered with periodic_task instead:
+
+    @periodic_task('mturk.expire_old_aws_keys', every=60 * 60)
+    def expire_old_aws_keys(job: Job): ...
+
+The worker enqueues it when it's due. With several worker processes,
+only one of them enqueues each run (see enqueue_due_periodic_tasks).
+"""
+
+import json
+import logging
+import threading
+import time
+import traceback
+from datetime import timedelta
+from typing import Callable, Dict, Optional
+
+import sentry_sdk
+from django.db import close_old_connections, connection
+from django.utils import timezone
+
+from .models import Job, PeriodicTask, Profile
+
+logger = logging.getLogger(__name__)
+
+# seconds between checks for new jobs when the queue is empty
+POLL_INTERVAL = 1
+# a running job whose heartbeat is older than this is considered abandoned.
+STALE_AFTER = 5 * 60
+# while a job runs, its heartbeat is updated this often, however long
+# a single step of the handler takes. well below STALE_AFTER,
+# so that a slow DB write doesn't get a live job requeued.
+HEARTBEAT_INTERVAL = 30
+
+_handlers: Dict[str, Callable] = {}
+# periodic task name -> seconds between runs
+_schedules: Dict[str, float] = {}
+
+
+def job_handler(name):
+    def decorator(func):
+        _handlers[name] = func
+        return func
+
+    return decorator
+
+
+def periodic_task(name, *, every):
+    """a job handler that the worker also enqueues every [every] seconds,
+    with Job.PERIODIC_PRIORITY. the handler gets no other arguments
+    (unless it enqueues itself with some).
+    """
+
+    def decorator(func):
+        _schedules[name] = every
+        return job_handler(name)(func)
+
+    return decorator
+
+
+def enqueue(
+    name, *, profile: Profile = None, subject='', description='', priority=0, **args
+) -> Job:
+    if name not in _handlers:
+        raise ValueError(f'No job handler registered for "{name}"')
+    return Job.objects.create(
+        name=name,
+        args_json=json.dumps(args),
+        profile=profile,
+        subject=subject,
+        description=description,
+        priority=priority,
+    )
+
+
+def claim_next_job() -> Optional[Job]:
+    # several worker processes may poll at once. the conditional update
+    # makes sure only one of them gets each job (works on any DB backend).
+    queued_ids = (
+        Job.objects.filter(status=Job.QUEUED)
+        .order_by('-priority', 'id')
+        .values_list('id', flat=True)[:10]
+    )
+    for job_id in queued_ids:
+        claimed = Job.objects.filter(id=job_id, status=Job.QUEUED).update(
+            status=Job.RUNNING, started=timezone.now(), heartbeat=time.time()
+        )
+        if claimed:
+            return Job.get(id=job_id)
+    return None
+
+
+def higher_priority_job_waiting(job: Job) -> bool:
+    """for long jobs that can stop partway and let it go first"""
+    return Job.objects.filter(status=Job.QUEUED, priority__gt=job.priority).exists()
+
+
+def requeue_stale_jobs():
+    stale_threshold = time.time() - STALE_AFTER
+    num_requeued = Job.objects.filter(
+        status=Job.RUNNING, heartbeat__lt=stale_threshold
+    ).update(status=Job.QUEUED)
+    if num_requeued:
+        logger.warning(f'Requeued {num_requeued} abandoned jobs')
+
+
+def enqueue_due_periodic_tasks():
+    now = time.time()
+    next_runs = dict(PeriodicTask.objects.values_list('name', 'next_run'))
+    for name, interval in _schedules.items():
+        if name not in next_runs:
+            # a new task runs as soon as a worker sees it
+            PeriodicTask.insert_or_get(['name'], name=name, next_run=now)
+        elif next_runs[name] > now:
+            continue
+        # like claim_next_job, only one worker process gets to move it forward
+        claimed = PeriodicTask.objects.filter(name=name, next_run__lte=now).update(
+            next_run=now + interval
+        )
+        if not claimed:
+            continue
+        # if the last run is still going (or waiting), don't pile up another
+        if Job.objects.filter(name=name, status__in=[Job.QUEUED, Job.RUNNING]).exists():
+            logger.info(f'Skipping {name}: the previous run has not finished')
+            continue
+        enqueue(
+            name, description=f'Periodic task {name}', priority=Job.PERIODIC_PRIORITY
+        )
+
+
+def _send_heartbeats(job_id, stop: threading.Event):
+    try:
+        while not stop.wait(HEARTBEAT_INTERVAL):
+            try:
+                Job.objects.filter(id=job_id, status=Job.RUNNING).update(
+                    heartbeat=time.time()
+                )
+            except Exception:
+                # e.g. the connection dropped. try again next time.
+                logger.exception(f'Could not update the heartbeat of job {job_id}')
+                close_old_connections()
+    finally:
+        # this thread has its own connection
+        connection.close()
+
+
+def run_job(job: Job):
+    handler = _handlers[job.name]
+    # from a separate thread, so that the job stays claimed
+    # even if the handler doesn't call set_progress for a while.
+    stop_heartbeats = threading.Event()
+    heartbeats = threading.Thread(
+        target=_send_heartbeats, args=(job.id, stop_heartbeats), daemon=True
+    )
+    heartbeats.start()
+    try:
+        handler(job, **job.args)
+    except Exception:
+        sentry_sdk.capture_exception()
+        logger.exception(f'{job} failed')
+        job.status = Job.FAILED
+        job.message = traceback.format_exc()
+    else:
+        job.status = Job.DONE
+    finally:
+        stop_heartbeats.set()
+        heartbeats.join()
+    job.finished = timezone.now()
+    job.save(update_fields=['status', 'message', 'finished'])
+
+
+def run_worker(*, stop_after_idle=None):
+    """runs jobs until interrupted.
+    stop_after_idle: stop when the queue has been empty for this many seconds
+    (for tests and one-off runs).
+    """
+    idle_since = time.time()
+    while True:
+        # like Django does at the start/end of each request
+        close_old_connections()
+        requeue_stale_jobs()
+        enqueue_due_periodic_tasks()
+        job = claim_next_job()
+        if job:
+            logger.info(f'Running {job}')
+            run_job(job)
+            idle_since = time.time()
+            continue
+        if stop_after_idle is not None and time.time() - idle_since > stop_after_idle:
+            return
+        time.sleep(POLL_INTERVAL)
+
+
+# periodic tasks create a job per run, which nobody looks at after it's done
+KEEP_PERIODIC_JOBS_FOR = timedelta(days=7)
+
+
+@periodic_task('hr.delete_old_periodic_jobs', every=24 * 60 * 60)
+def delete_old_periodic_jobs(job: Job):
+    Job.objects.filter(
+        name__in=list(_schedules),
+        status__in=[Job.DONE, Job.FAILED],
+        finished__lt=timezone.now() - KEEP_PERIODIC_JOBS_FOR,
+    ).delete()
@@ -0,0 +1,14 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from hr.jobs import run_worker
+
+
+class Command(BaseCommand):
+    help = 'Runs background jobs (e.g. MTurk payments) and periodic tasks. See hr.jobs'
+
+    def handle(self, *args, **options):
+        logging.basicConfig(level=logging.INFO)
+        self.stdout.write('Worker started')
+        run_worker()
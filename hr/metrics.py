@@ -0,0 +1,209 @@
+"""In-process metrics, served in Prometheus' text format by hr.views.Metrics.
+
+Each process (gunicorn worker, runworker) has its own counters,
+so a scrape only sees the process that happened to handle it.
+Prometheus adds an 'instance' label per target, so to see everything,
+scrape each process, or sum the rates over a few scrapes.
+
+Recording is a dict lookup and a few additions under a lock,
+so it's cheap enough to leave on everywhere.
+"""
+
+import bisect
+import contextvars
+import threading
+import time
+from typing import List
+
+# seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+_registry: List['_Metric'] = []
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class _Metric:
+    type = ''
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.type}']
+        with self._lock:
+            items = [(key, self._copy(value)) for key, value in self._values.items()]
+        for key, value in sorted(items):
+            lines.extend(self._render_value(list(zip(self.labelnames, key)), value))
+        return lines
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _copy(self, value):
+        return value
+
+    def _render_value(self, pairs, value):
+        return [f'{self.name}_total{_format_labels(pairs)} {value}']
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        # the last slot is for values above the highest bucket
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # [count per bucket, sum]
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0]
+            state[0][i] += 1
+            state[1] += value
+
+    def _copy(self, value):
+        return list(value[0]), value[1]
+
+    def _render_value(self, pairs, value):
+        counts, total = value
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            lines.append(
+                f'{self.name}_bucket{_format_labels(pairs + [("le", bound)])} {cumulative}'
+            )
+        lines.append(f'{self.name}_sum{_format_labels(pairs)} {total}')
+        lines.append(f'{self.name}_count{_format_labels(pairs)} {cumulative}')
+        return lines
+
+
+def render() -> str:
+    return '\n'.join(line for metric in _registry for line in metric.render()) + '\n'
+
+
+otree_api_seconds = Histogram(
+    'hr_otree_api_seconds',
+    'Calls to the oTree REST API',
+    ['site', 'endpoint', 'outcome'],
+)
+mturk_api_seconds = Histogram(
+    'hr_mturk_api_seconds',
+    'Calls to the MTurk API, including botocore retries',
+    ['operation', 'sandbox', 'outcome'],
+)
+view_seconds = Histogram(
+    'hr_view_seconds', 'Time to produce the response', ['view', 'method']
+)
+view_queries = Histogram(
+    'hr_view_queries',
+    'DB queries per request',
+    ['view', 'method'],
+    buckets=QUERY_COUNT_BUCKETS,
+)
+view_query_seconds = Histogram(
+    'hr_view_query_seconds', 'Time per request spent in DB queries', ['view', 'method']
+)
+# not by session: every session would add a time series that never goes away
+redirects = Counter(
+    'hr_redirects', 'Participants sent to oTree by the redirect views', ['app']
+)
+
+
+# per-view query stats.
+# contextvars are copied into sync_to_async threads,
+# so queries made by async views are counted too.
+
+
+class QueryStats:
+    __slots__ = ['count', 'seconds']
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+current_query_stats: contextvars.ContextVar = contextvars.ContextVar(
+    'current_query_stats', default=None
+)
+
+
+def count_queries(execute, sql, params, many, context):
+    """installed on every DB connection as an execute_wrapper. see hr.signals"""
+    stats = current_query_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.count += 1
+        stats.seconds += time.perf_counter() - start
+
+
+# MTurk calls. these are botocore event handlers, see mturk.utils._make_mturk_client
+
+
+def _before_mturk_call(model, context, **kwargs):
+    context['metrics_operation'] = model.name
+    context['metrics_start'] = time.perf_counter()
+
+
+def _record_mturk_call(context, sandbox, outcome):
+    start = context.get('metrics_start')
+    if start is not None:
+        mturk_api_seconds.observe(
+            time.perf_counter() - start,
+            operation=context['metrics_operation'],
+            sandbox=sandbox,
+            outcome=outcome,
+        )
+
+
+def instrument_mturk_client(client, *, use_sandbox):
+    sandbox = 'true' if use_sandbox else 'false'
+
+    def after_call(http_response, parsed, context, **kwargs):
+        if http_response.status_code < 300:
+            outcome = 'ok'
+        else:
+            # e.g. ThrottlingException. these are a small, fixed set.
+            outcome = parsed.get('Error', {}).get('Code') or str(http_response.status_code)
+        _record_mturk_call(context, sandbox, outcome)
+
+    def after_call_error(context, **kwargs):
+        # connection errors etc.
+        _record_mturk_call(context, sandbox, 'unreachable')
+
+    events = client.meta.events
+    events.register('before-call.mturk', _before_mturk_call)
+    events.register('after-call.mturk', after_call)
+    events.register('after-call-error.mturk', after_call_error)
@@ -0,0 +1,206 @@
+import asyncio
+import hmac
+import random
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+from .models import RequestProfile
+from .profiler import StackSampler
+
+
+class StaticFilesMiddleware:
+    """WhiteNoiseMiddleware, which django_heroku adds, is sync-only.
+    a single sync-only middleware makes Django run the whole chain
+    on one thread, so the async views would run one at a time.
+    this lets WhiteNoise look at requests for static files,
+    and passes everything else on without leaving the event loop.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+        # it returns our None when it doesn't have the file
+        self.whitenoise = WhiteNoiseMiddleware(lambda request: None)
+        self.static_prefix = settings.STATIC_URL
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if request.path_info.startswith(self.static_prefix):
+            response = self.whitenoise(request)
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        if request.path_info.startswith(self.static_prefix):
+            response = await sync_to_async(self.whitenoise)(request)
+            if response is not None:
+                return response
+        return await self.get_response(request)
+
+
+class MetricsMiddleware:
+    """records the time and DB queries of each request, by view.
+    it should be first in MIDDLEWARE, so that the queries made by
+    the session and auth middleware are counted too.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # so that Django calls us as async, and the async views
+            # don't need to be adapted to sync and back.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        stats = metrics.QueryStats()
+        token = metrics.current_query_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            metrics.current_query_stats.reset(token)
+            self._record(request, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = metrics.QueryStats()
+        token = metrics.current_query_stats.set(stats)
+        start = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            metrics.current_query_stats.reset(token)
+            self._record(request, stats, time.perf_counter() - start)
+
+    def _record(self, request, stats, seconds):
+        match = request.resolver_match
+        # label 404s etc together, rather than by their (arbitrary) path
+        labels = dict(view=match.url_name if match else '', method=request.method)
+        metrics.view_seconds.observe(seconds, **labels)
+        metrics.view_queries.observe(stats.count, **labels)
+        metrics.view_query_seconds.observe(stats.seconds, **labels)
+
+
+class ProfilerMiddleware:
+    """profiles a request with hr.profiler.StackSampler and saves a RequestProfile,
+    which staff can browse in the admin. a request is profiled if:
+    - it has an 'X-Profile' header equal to settings.PROFILER_TOKEN
+    - a staff user adds ?profile=1 to the URL
+    - it's picked at random, with probability settings.PROFILER_SAMPLE_RATE
+    it goes after AuthenticationMiddleware, since it checks request.user.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        is_staff = self._staff_asked(request) and request.user.is_staff
+        trigger = self._get_trigger(request, is_staff)
+        if trigger is None:
+            return self.get_response(request)
+        profiling = self._start(request, trigger)
+        response = None
+        try:
+            response = self.get_response(request)
+            return response
+        finally:
+            self._finish(profiling, response)
+
+    async def __acall__(self, request):
+        is_staff = False
+        # request.user is lazy, and loading it queries the DB,
+        # so only leave the event loop for the requests that need it.
+        if self._staff_asked(request):
+            is_staff = await sync_to_async(lambda: request.user.is_staff)()
+        trigger = self._get_trigger(request, is_staff)
+        if trigger is None:
+            return await self.get_response(request)
+        profiling = self._start(request, trigger)
+        response = None
+        try:
+            response = await self.get_response(request)
+            return response
+        finally:
+            await sync_to_async(self._finish)(profiling, response)
+
+    @staticmethod
+    def _staff_asked(request):
+        return request.GET.get('profile') == '1'
+
+    def _get_trigger(self, request, is_staff):
+        token = settings.PROFILER_TOKEN
+        header = request.headers.get('X-Profile')
+        if header and token and hmac.compare_digest(header, token):
+            return RequestProfile.HEADER
+        if is_staff:
+            return RequestProfile.STAFF
+        rate = settings.PROFILER_SAMPLE_RATE
+        if rate and random.random() < rate:
+            return RequestProfile.SAMPLED
+        return None
+
+    def _start(self, request, trigger):
+        sampler = StackSampler.start(settings.PROFILER_INTERVAL_MS)
+        if sampler is None:
+            return None
+        stats = metrics.current_query_stats.get()
+        return dict(
+            request=request,
+            trigger=trigger,
+            sampler=sampler,
+            stats=stats,
+            num_queries_before=stats.count if stats else None,
+            start=time.perf_counter(),
+        )
+
+    def _finish(self, profiling, response):
+        if profiling is None:
+            return
+        duration = time.perf_counter() - profiling['start']
+        sampler: StackSampler = profiling['sampler']
+        sampler.stop()
+        request = profiling['request']
+        match = request.resolver_match
+        stats = profiling['stats']
+        report = RequestProfile.objects.create(
+            method=request.method,
+            path=request.path[:255],
+            view=match.url_name if match else '',
+            session_code=match.kwargs.get('code', '') if match else '',
+            status_code=response.status_code if response else None,
+            duration_ms=duration * 1000,
+            num_queries=stats.count - profiling['num_queries_before'] if stats else None,
+            trigger=profiling['trigger'],
+            summary=sampler.summary(),
+            stacks=sampler.collapsed_stacks(),
+        )
+        if response is not None:
+            response['X-Profile-Id'] = str(report.id)
+        # keep only the most recent ones
+        max_reports = settings.PROFILER_MAX_REPORTS
+        oldest_kept = RequestProfile.objects.order_by('-id').values_list(
+            'id', flat=True
+        )[max_reports - 1 : max_reports]
+        if oldest_kept:
+            RequestProfile.objects.filter(id__lt=oldest_kept[0]).delete()
@@ -0,0 +1,14 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:29
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0004_auto_20210614_0923'),
+        ('hr', '0006_auto_20210709_1729'),
+    ]
+
+    operations = [
+    ]
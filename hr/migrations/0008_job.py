@@ -0,0 +1,36 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0007_merge_20261018_0629'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255)),
+                ('args_json', models.TextField(default='{}')),
+                ('status', models.CharField(db_index=True, default='queued', max_length=20)),
+                ('subject', models.CharField(db_index=True, default='', max_length=255)),
+                ('description', models.CharField(default='', max_length=255)),
+                ('progress_done', models.IntegerField(default=0)),
+                ('progress_total', models.IntegerField(default=0)),
+                ('message', models.TextField(default='')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('started', models.DateTimeField(null=True)),
+                ('finished', models.DateTimeField(null=True)),
+                ('heartbeat', models.FloatField(null=True)),
+                ('profile', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='hr.profile')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
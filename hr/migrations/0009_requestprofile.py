@@ -0,0 +1,33 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0008_job'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('method', models.CharField(max_length=10)),
+                ('path', models.CharField(max_length=255)),
+                ('view', models.CharField(db_index=True, max_length=255)),
+                ('session_code', models.CharField(blank=True, db_index=True, max_length=255)),
+                ('status_code', models.IntegerField(null=True)),
+                ('duration_ms', models.FloatField(db_index=True)),
+                ('num_queries', models.IntegerField(null=True)),
+                ('trigger', models.CharField(max_length=20)),
+                ('summary', models.TextField()),
+                ('stacks', models.TextField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
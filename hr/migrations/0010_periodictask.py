@@ -0,0 +1,24 @@
+# Generated by Django 3.1.7 on 2026-10-18 08:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0009_requestprofile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PeriodicTask',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('next_run', models.FloatField()),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 07:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0010_periodictask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='job',
+            name='priority',
+            field=models.IntegerField(default=0),
+        ),
+    ]
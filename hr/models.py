@@ -1,14 +1,20 @@
 from django.contrib.auth.models import User
+import hashlib
 import json
+import time
 from typing import Type, List
 
 from django.contrib.auth.models import User
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.cache import caches
+from django.db import connection, models
 from django.http import Http404
-from typing import Type, TypeVar, List
+from typing import Type, TypeVar, List, Optional, Tuple
 
-from otree_api import call_api
+from otree_api import call_api, GET
+
+from . import metrics
 
 ModelTypeVar = TypeVar('ModelTypeVar')
 
@@ -36,6 +42,63 @@ class BaseModel(models.Model):
     def filter(cls: Type[ModelTypeVar], **kwargs) -> List[ModelTypeVar]:
         return list(cls.objects.filter(**kwargs))
 
+    @classmethod
+    def insert_or_get(cls, unique_fields: List[str], **values) -> Tuple[dict, bool]:
+        """Like get_or_create, but done with a single INSERT ... ON CONFLICT
+        on PostgreSQL and SQLite, so it's one round trip, and concurrent calls
+        can't raise IntegrityError.
+        unique_fields must be covered by a unique constraint.
+        An existing row is not modified.
+        Returns the stored row's values (for the same fields as [values]),
+        and whether the row already existed.
+        """
+        vendor = connection.vendor
+        if vendor not in ['postgresql', 'sqlite']:
+            obj, created = cls.objects.get_or_create(
+                **{name: values[name] for name in unique_fields}, defaults=values
+            )
+            return {name: getattr(obj, name) for name in values}, not created
+
+        qn = connection.ops.quote_name
+        fields = [cls._meta.get_field(name) for name in values]
+        columns = ', '.join(qn(f.column) for f in fields)
+        placeholders = ', '.join(['%s'] * len(fields))
+        conflict = ', '.join(
+            qn(cls._meta.get_field(name).column) for name in unique_fields
+        )
+        params = [f.get_db_prep_save(values[f.attname], connection) for f in fields]
+        sql = (
+            f'INSERT INTO {qn(cls._meta.db_table)} ({columns}) VALUES ({placeholders}) '
+            f'ON CONFLICT ({conflict}) '
+        )
+
+        if vendor == 'postgresql':
+            # the no-op update is so that RETURNING also gives us the existing row.
+            # xmax is 0 for a newly inserted row.
+            first = qn(cls._meta.get_field(unique_fields[0]).column)
+            sql += (
+                f'DO UPDATE SET {first} = EXCLUDED.{first} '
+                f'RETURNING {columns}, (xmax <> 0)'
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                *row, existed = cursor.fetchone()
+            row = {f.attname: f.to_python(value) for f, value in zip(fields, row)}
+            return row, existed
+
+        # SQLite runs in-process, so a second query is cheap
+        with connection.cursor() as cursor:
+            cursor.execute(sql + 'DO NOTHING', params)
+            existed = cursor.rowcount == 0
+        if not existed:
+            return dict(values), False
+        row = (
+            cls.objects.filter(**{name: values[name] for name in unique_fields})
+            .values(*values)
+            .get()
+        )
+        return row, True
+
     def __str__(self):
         return f'{type(self)}:{self.pk}'
 
@@ -75,16 +138,92 @@ class Site(BaseModel):
         return f'Site:self.url'
 
     def call_api(self, method, *path_parts, **params) -> dict:
-        return call_api(self.url, self.rest_key, method, *path_parts, **params)
+        outcome = 'ok'
+        start = time.perf_counter()
+        try:
+            return call_api(self.url, self.rest_key, method, *path_parts, **params)
+        except Exception as exc:
+            outcome = type(exc).__name__
+            raise
+        finally:
+            # not the full path, which contains the session code
+            metrics.otree_api_seconds.observe(
+                time.perf_counter() - start,
+                site=self.url,
+                endpoint=path_parts[0] if path_parts else '',
+                outcome=outcome,
+            )
+
+    async def acall_api(self, method, *path_parts, **params) -> dict:
+        # thread_sensitive=False so that concurrent calls run in parallel threads
+        # rather than queueing up on the main thread.
+        return await sync_to_async(self.call_api, thread_sensitive=False)(
+            method, *path_parts, **params
+        )
+
+    def get_session_data(self, code, participant_labels=None, *, fresh=False) -> dict:
+        '''GET from the "sessions" endpoint, going through the otree_api cache,
+        since the payment pages tend to request the same participants
+        a few seconds apart.
+        fresh=True discards whatever is cached for this session and fetches it again.
+        Use it when the data is used to make payments.
+        '''
+        if fresh:
+            self.invalidate_session_data(code)
+        params = {}
+        if participant_labels is not None:
+            params['participant_labels'] = list(participant_labels)
+        cache = caches['otree_api']
+        key = self._session_data_cache_key(code, participant_labels)
+        data = cache.get(key)
+        if data is None:
+            data = self.call_api(GET, 'sessions', code, **params)
+            cache.set(key, data)
+        return data
+
+    async def aget_session_data(self, code, participant_labels=None, *, fresh=False):
+        return await sync_to_async(self.get_session_data, thread_sensitive=False)(
+            code, participant_labels, fresh=fresh
+        )
+
+    def invalidate_session_data(self, code):
+        # we can't enumerate the cached label combinations,
+        # so instead we move the session to a new namespace.
+        caches['otree_api'].set(self._session_cache_version_key(code), time.time_ns(), None)
+
+    def _session_cache_version_key(self, code):
+        return f'sessions-version:{self.id}:{code}'
+
+    def _session_data_cache_key(self, code, participant_labels):
+        # if the version key was evicted, this starts a new version,
+        # which is equivalent to invalidating.
+        version = caches['otree_api'].get_or_set(
+            self._session_cache_version_key(code), time.time_ns, None
+        )
+        if participant_labels is None:
+            labels_hash = 'all'
+        else:
+            labels_json = json.dumps(sorted(participant_labels))
+            labels_hash = hashlib.sha1(labels_json.encode('utf8')).hexdigest()
+        return f'sessions:{self.id}:{version}:{code}:{labels_hash}'
 
 
 class BaseSession(BaseModel):
     class Meta:
         abstract = True
         unique_together = ['site', 'code']
+        indexes = [
+            # for page_for_site
+            models.Index(fields=['site', '-id'], name='%(app_label)s_%(class)s_recent'),
+        ]
+
+    # the columns shown in the session list. see page_for_site
+    list_fields = ['id', 'code']
 
     site = models.ForeignKey(Site, on_delete=models.CASCADE, related_name='+')
-    code = models.CharField(max_length=255)
+    # the experimenter views look sessions up by code alone,
+    # which the (site, code) constraint's index doesn't cover.
+    code = models.CharField(max_length=255, db_index=True)
     config_json = models.TextField(default='')
     session_wide_url = models.CharField(max_length=255)
     admin_url = models.CharField(max_length=255)
@@ -93,6 +232,152 @@ class BaseSession(BaseModel):
     def __str__(self):
         return f'Session:{self.code}'
 
+    @classmethod
+    def page_for_site(
+        cls, site_id, *, before_id=None, page_size=50
+    ) -> Tuple[list, Optional[int]]:
+        """the site's sessions, newest first, page_size at a time.
+        pass the returned id as before_id to get the next page,
+        which doesn't get slower for old pages like OFFSET does.
+        only list_fields are loaded, since config_json etc. can be large.
+        """
+        sessions = cls.objects.filter(site_id=site_id).only(*cls.list_fields)
+        if before_id is not None:
+            sessions = sessions.filter(id__lt=before_id)
+        # one extra, to know if there is a next page
+        sessions = list(sessions.order_by('-id')[: page_size + 1])
+        if len(sessions) > page_size:
+            return sessions[:page_size], sessions[page_size - 1].id
+        return sessions, None
+
     @property
     def config(self):
         return json.loads(self.config_json)
+
+    # the redirect views get a burst of traffic when a study goes live,
+    # and only need the session_wide_url, which rarely changes.
+    # so we cache it in-process. see hr.signals for invalidation.
+
+    @classmethod
+    def _redirect_cache_key(cls, id):
+        return f'session_wide_url:{cls._meta.label}:{id}'
+
+    @classmethod
+    def get_session_wide_url(cls, id) -> str:
+        cache = caches['redirects']
+        key = cls._redirect_cache_key(id)
+        url = cache.get(key)
+        if url is None:
+            url = cls.objects.filter(id=id).values_list('session_wide_url', flat=True).first()
+            if url is None:
+                raise Http404(f'This {cls.__name__} was not found in the database')
+            cache.set(key, url)
+        return url
+
+    def clear_redirect_cache(self):
+        caches['redirects'].delete(self._redirect_cache_key(self.id))
+
+
+class Job(BaseModel):
+    """Work that is too slow for a web request, like paying hundreds of workers.
+    It is run by the worker process (python manage.py runworker).
+    See hr.jobs. The queue is just this table, so no separate broker is needed.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+    # claim_next_job takes higher priorities first, so that periodic
+    # housekeeping doesn't hold up the jobs users are waiting for.
+    PERIODIC_PRIORITY = -1
+
+    # the name a handler was registered under with hr.jobs.job_handler
+    name = models.CharField(max_length=255)
+    priority = models.IntegerField(default=0)
+    args_json = models.TextField(default='{}')
+    status = models.CharField(max_length=20, default=QUEUED, db_index=True)
+    profile = models.ForeignKey(Profile, on_delete=models.CASCADE, null=True)
+    # what the job is about, so the UI can show its jobs,
+    # e.g. 'mturk.Session:12'. see job_subject()
+    subject = models.CharField(max_length=255, default='', db_index=True)
+    description = models.CharField(max_length=255, default='')
+    progress_done = models.IntegerField(default=0)
+    progress_total = models.IntegerField(default=0)
+    # summary for the user when the job has finished
+    message = models.TextField(default='')
+    created = models.DateTimeField(auto_now_add=True)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # updated while running, so that the jobs of a crashed worker can be retried.
+    heartbeat = models.FloatField(null=True)
+
+    def __str__(self):
+        return f'Job:{self.name}:{self.pk}'
+
+    @property
+    def args(self):
+        return json.loads(self.args_json)
+
+    def is_active(self):
+        return self.status in [self.QUEUED, self.RUNNING]
+
+    def progress_percent(self):
+        if not self.progress_total:
+            return 0
+        return int(100 * self.progress_done / self.progress_total)
+
+    def set_progress(self, done, total=None):
+        self.progress_done = done
+        if total is not None:
+            self.progress_total = total
+        self.heartbeat = time.time()
+        Job.objects.filter(id=self.id).update(
+            progress_done=self.progress_done,
+            progress_total=self.progress_total,
+            heartbeat=self.heartbeat,
+        )
+
+
+class PeriodicTask(BaseModel):
+    """When a task registered with hr.jobs.periodic_task is next due.
+    Every worker process checks this table, and the first one to move
+    next_run forward is the one that enqueues the task.
+    """
+
+    name = models.CharField(max_length=255, unique=True)
+    next_run = models.FloatField()
+
+    def __str__(self):
+        return f'PeriodicTask:{self.name}'
+
+
+def job_subject(instance: models.Model) -> str:
+    return f'{instance._meta.label}:{instance.pk}'
+
+
+class RequestProfile(BaseModel):
+    """A profiled request. See hr.middleware.ProfilerMiddleware"""
+
+    HEADER = 'header'
+    STAFF = 'staff'
+    SAMPLED = 'sampled'
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    method = models.CharField(max_length=10)
+    path = models.CharField(max_length=255)
+    # the URL name, e.g. 'MTurkPayments'
+    view = models.CharField(max_length=255, db_index=True)
+    session_code = models.CharField(max_length=255, blank=True, db_index=True)
+    status_code = models.IntegerField(null=True)
+    duration_ms = models.FloatField(db_index=True)
+    num_queries = models.IntegerField(null=True)
+    # why it was profiled
+    trigger = models.CharField(max_length=20)
+    summary = models.TextField()
+    # for flame graph tools. see hr.profiler.StackSampler.collapsed_stacks
+    stacks = models.TextField()
+
+    def __str__(self):
+        return f'{self.method} {self.path} ({self.duration_ms:.0f}ms)'
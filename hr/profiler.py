@@ -0,0 +1,105 @@
+"""A sampling profiler for single requests, used by hr.middleware.ProfilerMiddleware.
+
+While a request is profiled, a background thread records the Python stack
+of every busy thread every few milliseconds. Sampling (rather than cProfile)
+follows the request into the threads of sync_to_async/async_to_sync,
+and costs the same however many function calls the view makes.
+The catch is that other requests running at the same time show up too,
+so each stack starts with its thread's name.
+Only one request per process is profiled at a time.
+"""
+
+import collections
+import sys
+import threading
+from typing import Counter, Optional, Tuple
+
+# threads whose top frame is in these modules are waiting, not working.
+IDLE_MODULES = {
+    'threading',
+    'queue',
+    'selectors',
+    'socketserver',
+    'concurrent.futures.thread',
+    'asyncio.base_events',
+}
+
+# the stacks report lists the most common stacks, to keep the DB row small.
+MAX_STACKS = 500
+
+_active_lock = threading.Lock()
+
+
+def _frame_name(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class StackSampler:
+    def __init__(self, interval_ms):
+        self.interval = interval_ms / 1000
+        self.stacks: Counter[Tuple[str, ...]] = collections.Counter()
+        self.num_samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    @classmethod
+    def start(cls, interval_ms) -> Optional['StackSampler']:
+        """returns None if another request is already being profiled"""
+        if not _active_lock.acquire(blocking=False):
+            return None
+        sampler = cls(interval_ms)
+        sampler._thread.start()
+        return sampler
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        _active_lock.release()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            thread_names = {t.ident: t.name for t in threading.enumerate()}
+            self.num_samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if frame.f_globals.get('__name__') in IDLE_MODULES:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                stack.reverse()
+                self.stacks[tuple(stack)] += 1
+
+    def summary(self, limit=50) -> str:
+        """functions by the number of samples they appear in (total),
+        and are at the top of (self)
+        """
+        total = collections.Counter()
+        own = collections.Counter()
+        for stack, count in self.stacks.items():
+            # a recursive function is counted once per sample
+            for name in set(stack[1:]):
+                total[name] += count
+            own[stack[-1]] += count
+        lines = [
+            f'{self.num_samples} samples, {self.interval * 1000:g}ms apart',
+            '',
+            f'{"total":>7} {"self":>7}  function',
+        ]
+        for name, count in total.most_common(limit):
+            lines.append(f'{count:>7} {own[name]:>7}  {name}')
+        return '\n'.join(lines)
+
+    def collapsed_stacks(self) -> str:
+        """in the format that flame graph tools take
+        (e.g. flamegraph.pl, speedscope)
+        """
+        return '\n'.join(
+            f"{';'.join(stack)} {count}"
+            for stack, count in self.stacks.most_common(MAX_STACKS)
+        )
+
@@ -1,7 +1,10 @@
-from django.db.models.signals import post_save
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from hr.models import Profile
+from hr.models import Profile, Site
 from django.contrib.auth.models import User
+from otree_api import close_http_session
+from hr import metrics
 
 
 @receiver(post_save, sender=User)
@@ -11,3 +14,28 @@ def create_or_update_user_profile(sender, instance, created, **kwargs):
         user.email = user.username
         user.save()
         Profile.objects.create(user=user)
+
+
+@receiver(post_delete, sender=Site)
+def close_site_connections(sender, instance, **kwargs):
+    # another Site may have the same URL, but then it will just reconnect.
+    close_http_session(instance.url)
+
+
+@receiver(pre_save, sender=Site)
+def close_connections_to_old_url(sender, instance, **kwargs):
+    # sites are rarely saved, so the extra query doesn't matter.
+    # other processes stop using their session for the old URL,
+    # and the server closes its idle connections.
+    if instance.pk is None:
+        return
+    old_url = Site.objects.filter(pk=instance.pk).values_list('url', flat=True).first()
+    if old_url and old_url != instance.url:
+        close_http_session(old_url)
+
+
+@receiver(connection_created)
+def count_queries(sender, connection, **kwargs):
+    # this fires again when a closed connection reconnects
+    if metrics.count_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.count_queries)
@@ -1,26 +1,61 @@
+import asyncio
+import hmac
 import html
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 import vanilla
+from django.conf import settings
 from django.contrib.auth import login
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseForbidden
 from django.shortcuts import redirect, reverse
 from django.utils import timezone
 from otree_api import BaseOTreeApiError
+from . import metrics
 from .forms import UserCreationForm, CreateSiteForm
 from .models import Site, Profile
 
 
+def otree_error_response(exc: BaseOTreeApiError):
+    str_exc = html.escape(str(exc))
+    return HttpResponse(
+        # the response might be a traceback if the server is in debug mode
+        f'The oTree server reported an error: <pre>{str_exc}</pre>'
+    )
+
+
 class ExperimenterMixin:
     def dispatch(self, request, *args, **kwargs):
         self.profile = self.request.user.profile
         try:
             return super().dispatch(request, *args, **kwargs)
         except BaseOTreeApiError as exc:
-            str_exc = html.escape(str(exc))
-            return HttpResponse(
-                # the response might be a traceback if the server is in debug mode
-                f'The oTree server reported an error: <pre>{str_exc}</pre>'
-            )
+            return otree_error_response(exc)
+
+
+class AsyncExperimenterMixin:
+    '''For views that mostly wait on oTree/MTurk. Their handlers are coroutines
+    (async def get/post), so under ASGI the worker can serve other requests
+    in the meantime, and a handler can run its independent calls concurrently.
+    DB access inside the handlers must be wrapped in sync_to_async.
+    '''
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # Django 3.1's View.as_view() doesn't mark async views,
+        # so the handler would call it as a sync view.
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.profile = await sync_to_async(lambda: request.user.profile)()
+        method = request.method.lower()
+        if method not in self.http_method_names or not hasattr(self, method):
+            return self.http_method_not_allowed(request, *args, **kwargs)
+        try:
+            return await getattr(self, method)(request, *args, **kwargs)
+        except BaseOTreeApiError as exc:
+            return otree_error_response(exc)
 
 
 class Settings(ExperimenterMixin, vanilla.UpdateView):
@@ -81,3 +116,15 @@ class Register(vanilla.CreateView):
         user = form.instance
         login(self.request, user)
         return redirect('Settings')
+
+
+class Metrics(vanilla.View):
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        auth = request.headers.get('Authorization', '')
+        has_token = token and hmac.compare_digest(auth, f'Bearer {token}')
+        if not (has_token or request.user.is_staff):
+            return HttpResponseForbidden()
+        return HttpResponse(
+            metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8'
+        )
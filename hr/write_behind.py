@@ -0,0 +1,156 @@
+import atexit
+import logging
+import threading
+from typing import Dict, Type
+
+from django.conf import settings
+from django.core import serializers
+from django.db import DataError, IntegrityError, close_old_connections, models
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindBuffer:
+    """Collects unsaved model instances and inserts them in batches
+    with bulk_create(ignore_conflicts=True), from a background thread.
+    It flushes every flush_interval_ms, or as soon as max_rows are pending,
+    and once more when the process exits.
+
+    Rows that conflict with existing rows are skipped, so the model needs a
+    unique constraint that describes a duplicate.
+    Rows the DB rejects for another reason (e.g. a foreign key to a deleted row),
+    and rows that can't be saved when the process exits, are logged as JSON
+    (which manage.py loaddata can read), since the log outlives the dyno's disk.
+
+    So this is weaker than saving right away: until a row is flushed,
+    it exists only in this process, and other processes don't see it.
+    A process that is killed without exiting normally loses its pending rows.
+    Only use it for rows where that is acceptable.
+    on_flush(instances) is called (in the background thread) after each batch
+    is written, e.g. to reconcile caches with what is actually in the DB.
+    """
+
+    def __init__(
+        self,
+        model: Type[models.Model],
+        *,
+        flush_interval_ms,
+        max_rows,
+        on_flush=None,
+    ):
+        self.model = model
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_rows = max_rows
+        self.on_flush = on_flush
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def add(self, instance: models.Model):
+        with self._lock:
+            self._pending.append(instance)
+            num_pending = len(self._pending)
+            if self._thread is None:
+                # started lazily, so that management commands
+                # and forked server processes don't each get an idle thread.
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+                atexit.register(self.flush_on_exit)
+        if num_pending >= self.max_rows:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            close_old_connections()
+            try:
+                self.flush()
+            except Exception:
+                # the rows were put back, so they are retried next time
+                logger.exception(f'Could not save {self.model.__name__} rows')
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, []
+        if not batch:
+            return
+        try:
+            self.model.objects.bulk_create(batch, ignore_conflicts=True)
+            saved = batch
+        except (IntegrityError, DataError):
+            # ignore_conflicts doesn't cover e.g. a foreign key to a session
+            # that was deleted, and one such row fails the whole batch.
+            saved = self._save_one_by_one(batch)
+        except Exception:
+            self._put_back(batch)
+            raise
+        if saved and self.on_flush:
+            self.on_flush(saved)
+
+    def _save_one_by_one(self, batch):
+        saved = []
+        rejected = []
+        try:
+            for instance in batch:
+                try:
+                    self.model.objects.bulk_create([instance], ignore_conflicts=True)
+                except (IntegrityError, DataError):
+                    rejected.append(instance)
+                else:
+                    saved.append(instance)
+        except Exception:
+            # e.g. the connection dropped. the rest are retried next time.
+            self._put_back(batch[len(saved) + len(rejected) :])
+            raise
+        finally:
+            if rejected:
+                self._set_aside(rejected, 'were rejected by the DB')
+        return saved
+
+    def _put_back(self, instances):
+        with self._lock:
+            self._pending = instances + self._pending
+
+    def _set_aside(self, instances, reason):
+        data = serializers.serialize('json', instances)
+        logger.error(f'{len(instances)} {self.model.__name__} rows {reason}: {data}')
+
+    def flush_on_exit(self):
+        # let a flush that is in progress finish, since daemon threads
+        # are killed when the process exits.
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join(timeout=10)
+        try:
+            self.flush()
+        except Exception:
+            logger.exception(f'Could not save {self.model.__name__} rows on exit')
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if batch:
+                self._set_aside(batch, 'could not be saved on exit')
+
+
+_buffers: Dict[Type[models.Model], WriteBehindBuffer] = {}
+_buffers_lock = threading.Lock()
+
+
+def get_buffer(model: Type[models.Model], on_flush=None) -> WriteBehindBuffer:
+    """one buffer per model, per process"""
+    try:
+        return _buffers[model]
+    except KeyError:
+        pass
+    with _buffers_lock:
+        if model not in _buffers:
+            _buffers[model] = WriteBehindBuffer(
+                model,
+                flush_interval_ms=settings.REDIRECT_FLUSH_INTERVAL_MS,
+                max_rows=settings.REDIRECT_FLUSH_MAX_ROWS,
+                on_flush=on_flush,
+            )
+        return _buffers[model]
+
@@ -26,10 +26,11 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'hr.apps.HrConfig',
     'mturk.apps.MturkConfig',
-    'prolific',
+    'prolific.apps.ProlificConfig',
 ]
 
 MIDDLEWARE = [
+    'hr.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -37,6 +38,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'hr.middleware.ProfilerMiddleware',
     'mturk.middleware.ExceptionMiddleware',
 ]
 
@@ -73,6 +75,58 @@ DATABASES = {
 }
 
 
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    # responses from oTree's "sessions" endpoint. See Site.get_session_data.
+    'otree_api': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'otree_api',
+        # seconds
+        'TIMEOUT': float(environ.get('OTREE_API_CACHE_TTL', 30)),
+        # when full, the least recently used entries are evicted.
+        'OPTIONS': {'MAX_ENTRIES': int(environ.get('OTREE_API_CACHE_MAX_ENTRIES', 200))},
+    },
+    # lookups done by the participant-facing redirect views.
+    # entries are cleared by signals in the process that changed the data,
+    # so other processes see changes only when their entries expire.
+    'redirects': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'redirects',
+        'TIMEOUT': 60 * 60,
+        'OPTIONS': {'MAX_ENTRIES': 50_000},
+    },
+}
+
+
+# max number of workers paid at the same time by a payment job.
+# it's lowered automatically while MTurk is throttling us.
+MTURK_PAYOUT_CONCURRENCY = int(environ.get('MTURK_PAYOUT_CONCURRENCY', 10))
+
+# lets Prometheus scrape /metrics/ with an 'Authorization: Bearer <token>' header.
+# (staff users can see it when logged in.)
+METRICS_TOKEN = environ.get('METRICS_TOKEN')
+
+# request profiling, see hr.middleware.ProfilerMiddleware.
+# requests with an 'X-Profile: <PROFILER_TOKEN>' header are profiled.
+PROFILER_TOKEN = environ.get('PROFILER_TOKEN')
+# e.g. 0.001 to profile 1 in 1000 requests
+PROFILER_SAMPLE_RATE = float(environ.get('PROFILER_SAMPLE_RATE', 0))
+PROFILER_INTERVAL_MS = float(environ.get('PROFILER_INTERVAL_MS', 5))
+PROFILER_MAX_REPORTS = int(environ.get('PROFILER_MAX_REPORTS', 1000))
+
+# for load testing against a stand-in for MTurk (see benchmarks.fake_mturk).
+# if set, it's used for both sandbox and live.
+MTURK_ENDPOINT_URL = environ.get('MTURK_ENDPOINT_URL')
+
+# if on, RedirectProlific doesn't wait for the DB to record a participant's arrival.
+# arrivals are saved in batches, every REDIRECT_FLUSH_INTERVAL_MS milliseconds
+# or when REDIRECT_FLUSH_MAX_ROWS are pending. see hr.write_behind
+# (RedirectMTurk always saves right away, see HITWorker.record_arrival)
+REDIRECT_WRITE_BEHIND = environ.get('REDIRECT_WRITE_BEHIND', '') in ['1', 'true', 'True']
+REDIRECT_FLUSH_INTERVAL_MS = int(environ.get('REDIRECT_FLUSH_INTERVAL_MS', 200))
+REDIRECT_FLUSH_MAX_ROWS = int(environ.get('REDIRECT_FLUSH_MAX_ROWS', 500))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
 
@@ -123,3 +177,11 @@ sentry_sdk.init(
 import django_heroku
 
 django_heroku.settings(locals())
+
+# see hr.middleware.StaticFilesMiddleware
+MIDDLEWARE = [
+    'hr.middleware.StaticFilesMiddleware'
+    if name == 'whitenoise.middleware.WhiteNoiseMiddleware'
+    else name
+    for name in MIDDLEWARE
+]
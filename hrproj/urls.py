@@ -1,4 +1,9 @@
+import asyncio
+import functools
+
+from asgiref.sync import sync_to_async
 from django.contrib import admin
+from django.contrib.auth.views import redirect_to_login
 from django.urls import path, include
 from django.contrib.auth.decorators import login_required
 
@@ -7,10 +12,25 @@ import mturk.views as mturk_views
 import prolific.views as prolific_views
 
 
+def async_login_required(view):
+    # login_required can't wrap async views in Django 3.1
+    @functools.wraps(view)
+    async def wrapped_view(request, *args, **kwargs):
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+
+    return wrapped_view
+
+
 def _make_path(route, cls, is_experimenter):
     view = cls.as_view()
     if is_experimenter:
-        view = login_required(view)
+        if asyncio.iscoroutinefunction(view):
+            view = async_login_required(view)
+        else:
+            view = login_required(view)
     return path(route, view, name=cls.__name__)
 
 
@@ -35,10 +55,18 @@ urlpatterns = [
     experimenter_path('ProlificPayments/<code>/', prolific_views.ProlificPayments),
     experimenter_path('MTurkPayments/<code>/', mturk_views.MTurkPayments),
     experimenter_path('ProlificSession/<code>/', prolific_views.ProlificSession),
+    experimenter_path(
+        'ProlificBonusExport/<code>/', prolific_views.ProlificBonusExport
+    ),
     experimenter_path('ManageHIT/<code>/', mturk_views.ManageHIT),
     experimenter_path('ExpireHIT/<code>/', mturk_views.ExpireHIT),
+    experimenter_path('ExtendHIT/<code>/', mturk_views.ExtendHIT),
+    experimenter_path('AddAssignments/<code>/', mturk_views.AddAssignments),
     experimenter_path('PayMTurk/<code>/', mturk_views.PayMTurk),
     experimenter_path('RejectMTurk/<code>/', mturk_views.RejectMTurk),
+    experimenter_path('MTurkPayoutReport/<code>/', mturk_views.MTurkPayoutReport),
+    # authenticated by a token or staff login, see hr.views.Metrics
+    public_path('metrics/', hr_views.Metrics),
     path('admin/', admin.site.urls),
     path('accounts/', include('django.contrib.auth.urls')),
 ]
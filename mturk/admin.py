@@ -28,3 +28,14 @@ class HITAdmin(admin.ModelAdmin):
 @admin.register(HITWorker)
 class HITWorkerAdmin(admin.ModelAdmin):
     list_display = ['assignment_id', 'worker_id', 'session']
+
+
+@admin.register(Assignment)
+class AssignmentAdmin(admin.ModelAdmin):
+    list_display = ['assignment_id', 'worker_id', 'status', 'submit_time', 'session']
+
+
+@admin.register(Payout)
+class PayoutAdmin(admin.ModelAdmin):
+    list_display = ['assignment_id', 'hitworker', 'bonus', 'bonus_sent', 'status', 'job']
+    list_filter = ['status']
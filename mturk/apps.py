@@ -5,4 +5,5 @@ class MturkConfig(AppConfig):
     name = 'mturk'
 
     def ready(self):
-        pass
+        # make the signals and job handlers register
+        from . import signals, jobs  # noqa
@@ -1,4 +1,5 @@
 from django import forms
+from django.utils import timezone
 
 
 class CreateHITForm(forms.Form):
@@ -9,3 +10,49 @@ class CreateHITForm(forms.Form):
         help_text="""If this box is checked, your HIT will not be published to the MTurk live site, but rather
           to the MTurk Sandbox, so you can test how it will look to MTurk workers.""",
     )
+
+
+class ExtendHITForm(forms.Form):
+    expiration = forms.DateTimeField(
+        label='New expiration (UTC)',
+        input_formats=['%Y-%m-%dT%H:%M'],
+        widget=forms.DateTimeInput(
+            attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'
+        ),
+    )
+
+    def clean_expiration(self):
+        expiration = self.cleaned_data['expiration']
+        if expiration <= timezone.now():
+            raise forms.ValidationError('Must be in the future')
+        return expiration
+
+
+class AddAssignmentsForm(forms.Form):
+    num_assignments = forms.IntegerField(
+        min_value=1,
+        label='Assignments to add to each HIT',
+        help_text="""MTurk does not allow a HIT that has fewer than 10 assignments
+          to be increased to 10 or more.""",
+    )
+
+    def __init__(self, *args, largest_hit=None, **kwargs):
+        """largest_hit: the most assignments any of the session's HITs has"""
+        super().__init__(*args, **kwargs)
+        self.largest_hit = largest_hit
+
+    def clean_num_assignments(self):
+        num_assignments = self.cleaned_data['num_assignments']
+        largest = self.largest_hit
+        # otherwise MTurk rejects it for each HIT separately
+        if largest is not None and largest < 10 <= largest + num_assignments:
+            msg = (
+                'MTurk does not allow a HIT that has fewer than 10 assignments '
+                f'to be increased to 10 or more. Some HITs have {largest}, '
+            )
+            if largest == 9:
+                msg += 'so no more can be added.'
+            else:
+                msg += f'so you can add at most {9 - largest}.'
+            raise forms.ValidationError(msg)
+        return num_assignments
@@ -0,0 +1,339 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from decimal import Decimal
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from hr.jobs import job_handler, enqueue, periodic_task, higher_priority_job_waiting
+from hr.models import Job, Profile, job_subject
+from .models import Session, HIT, Assignment, Payout
+from .utils import (
+    get_mturk_client,
+    evict_mturk_clients,
+    refresh_assignments,
+    AdaptiveLimiter,
+    MAX_CONCURRENT_CALLS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def create_payouts(job: Job, session: Session, payments: List[dict]) -> List[Payout]:
+    payouts = Payout.filter(job=job)
+    if payouts:
+        # the job is being retried
+        return payouts
+    # bonuses already sent by earlier jobs that failed to approve the assignment
+    bonused_assignment_ids = set(
+        Payout.objects.filter(
+            session=session,
+            assignment_id__in=[p['assignment_id'] for p in payments],
+            bonus_sent=True,
+        ).values_list('assignment_id', flat=True)
+    )
+    Payout.objects.bulk_create(
+        [
+            Payout(
+                job=job,
+                session=session,
+                hitworker_id=p['hitworker_id'],
+                assignment_id=p['assignment_id'],
+                bonus=Decimal(p['payoff']).quantize(Decimal('0.01')),
+                bonus_sent=p['assignment_id'] in bonused_assignment_ids,
+            )
+            for p in payments
+        ]
+    )
+    return Payout.filter(job=job)
+
+
+@job_handler('mturk.pay')
+def pay_workers(job: Job, session_id, payments: List[dict]):
+    """payments: dicts with hitworker_id, worker_id, assignment_id, payoff"""
+    session = Session.get(id=session_id)
+    mturk_client = get_mturk_client(job.profile, use_sandbox=session.use_sandbox)
+    payouts = create_payouts(job, session, payments)
+    worker_ids = {p['hitworker_id']: p['worker_id'] for p in payments}
+    num_done = sum(1 for p in payouts if p.status == Payout.PAID)
+    job.set_progress(num_done, len(payouts))
+
+    limiter = AdaptiveLimiter(settings.MTURK_PAYOUT_CONCURRENCY)
+
+    # runs in a worker thread, so no DB access here.
+    def pay(payout: Payout):
+        if payout.bonus > 0 and not payout.bonus_sent:
+            limiter.call(
+                mturk_client.send_bonus,
+                WorkerId=worker_ids[payout.hitworker_id],
+                AssignmentId=payout.assignment_id,
+                BonusAmount='{0:.2f}'.format(payout.bonus),
+                # prevent duplicate payments
+                UniqueRequestToken='{}_{}'.format(
+                    payout.hitworker_id, payout.assignment_id
+                ),
+                # this field is required.
+                Reason='Thank you',
+            )
+            payout.bonus_sent = True
+        # approve assignment should happen AFTER bonus, so that if bonus fails,
+        # the user will still show up in assignments_not_reviewed.
+        # worst case is that bonus succeeds but approval fails.
+        # in that case we record bonus_sent, so the retry only approves.
+        limiter.call(mturk_client.approve_assignment, AssignmentId=payout.assignment_id)
+
+    with ThreadPoolExecutor(max_workers=settings.MTURK_PAYOUT_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(pay, payout): payout
+            for payout in payouts
+            if payout.status != Payout.PAID
+        }
+        for future in as_completed(futures):
+            payout = futures[future]
+            # a failure only affects this worker; we keep paying the others.
+            try:
+                future.result()
+            except Exception as e:
+                payout.status = Payout.FAILED
+                payout.error = str(e)
+                logger.error(
+                    f'Could not pay {worker_ids[payout.hitworker_id]}: {payout.error}'
+                )
+            else:
+                payout.status = Payout.PAID
+                payout.error = ''
+                num_done += 1
+                Assignment.set_status([payout.assignment_id], 'Approved')
+            payout.save(update_fields=['status', 'error', 'bonus_sent'])
+            job.set_progress(num_done)
+
+    failed = [p for p in payouts if p.status == Payout.FAILED]
+    msg = 'Successfully made {} payments.'.format(num_done)
+    if failed:
+        msg += ' {} payments failed:'.format(len(failed))
+        for payout in failed:
+            msg += f'\n{worker_ids[payout.hitworker_id]}: {payout.error}'
+    job.message = msg
+
+
+def enqueue_rejections(
+    session: Session, profile: Profile, assignment_ids: List[str], feedback: str
+) -> Optional[Job]:
+    """Queue a background job that rejects these assignments.
+    Safe to call repeatedly with the same assignments (e.g. on every load of
+    the payments page): assignments that already have a reject queued,
+    or were already reviewed, are skipped.
+    Returns None if there is nothing left to reject.
+    """
+    if not assignment_ids:
+        return None
+    with transaction.atomic():
+        known = {
+            a.assignment_id: a
+            for a in Assignment.objects.select_for_update().filter(
+                session=session, assignment_id__in=assignment_ids
+            )
+        }
+        # assignments that haven't been synced yet are passed through;
+        # MTurk will tell us if they can't be rejected.
+        to_reject = [
+            assignment_id
+            for assignment_id in dict.fromkeys(assignment_ids)
+            if assignment_id not in known or known[assignment_id].is_unreviewed()
+        ]
+        if not to_reject:
+            return None
+        Assignment.objects.filter(assignment_id__in=to_reject).update(
+            reject_requested=True
+        )
+        return enqueue(
+            'mturk.reject',
+            profile=profile,
+            subject=job_subject(session),
+            description=f'Reject {len(to_reject)} assignments',
+            session_id=session.id,
+            assignment_ids=to_reject,
+            feedback=feedback,
+        )
+
+
+@job_handler('mturk.reject')
+def reject_assignments(job: Job, session_id, assignment_ids: List[str], feedback):
+    session = Session.get(id=session_id)
+    mturk_client = get_mturk_client(job.profile, use_sandbox=session.use_sandbox)
+    # if the job is being retried, skip the ones that were already done
+    already_rejected = set(
+        Assignment.objects.filter(
+            assignment_id__in=assignment_ids, status='Rejected'
+        ).values_list('assignment_id', flat=True)
+    )
+    job.set_progress(len(already_rejected), len(assignment_ids))
+
+    try:
+        num_done, errors = _reject(
+            job, mturk_client, assignment_ids, already_rejected, feedback
+        )
+    finally:
+        # whatever wasn't rejected can be paid, or rejected again
+        Assignment.objects.filter(
+            assignment_id__in=assignment_ids, reject_requested=True
+        ).exclude(status='Rejected').update(reject_requested=False)
+
+    msg = 'Successfully rejected {} assignments.'.format(num_done)
+    if errors:
+        msg += ' {} rejections failed:'.format(len(errors))
+        for assignment_id, error in errors.items():
+            msg += f'\n{assignment_id}: {error}'
+    job.message = msg
+
+
+def _reject(job: Job, mturk_client, assignment_ids, already_rejected, feedback):
+    num_done = len(already_rejected)
+    limiter = AdaptiveLimiter(settings.MTURK_PAYOUT_CONCURRENCY)
+    errors = {}
+
+    with ThreadPoolExecutor(max_workers=settings.MTURK_PAYOUT_CONCURRENCY) as executor:
+        futures = {
+            executor.submit(
+                limiter.call,
+                mturk_client.reject_assignment,
+                AssignmentId=assignment_id,
+                RequesterFeedback=feedback,
+            ): assignment_id
+            for assignment_id in assignment_ids
+            if assignment_id not in already_rejected
+        }
+        for future in as_completed(futures):
+            assignment_id = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                errors[assignment_id] = str(e)
+                logger.error(f'Could not reject {assignment_id}: {e}')
+            else:
+                num_done += 1
+                Assignment.set_status([assignment_id], 'Rejected')
+            job.set_progress(num_done)
+    return num_done, errors
+
+
+# periodic housekeeping, run by the worker. see hr.jobs.periodic_task
+
+AWS_KEYS_MAX_AGE = timedelta(weeks=2)
+# MTurk auto-approves an assignment at most 30 days after it's submitted,
+# so after that, an expired session's assignments can't change anymore.
+SYNC_AFTER_EXPIRATION = 30 * 24 * 60 * 60
+# the expiration can be changed outside oTree HR (e.g. reopening a HIT that expired),
+# so we also check sessions that expired recently.
+EXPIRATION_CHECK_WINDOW = 24 * 60 * 60
+
+
+@periodic_task('mturk.expire_old_aws_keys', every=60 * 60)
+def expire_old_aws_keys(job: Job):
+    stale_threshold = timezone.now() - AWS_KEYS_MAX_AGE
+    stale_profiles = Profile.objects.filter(
+        aws_keys_added__lte=stale_threshold, aws_secret_access_key__isnull=False
+    )
+    # update() doesn't send post_save, so we evict the pooled clients ourselves.
+    profile_ids = list(stale_profiles.values_list('id', flat=True))
+    Profile.objects.filter(id__in=profile_ids).update(aws_secret_access_key=None)
+    for profile_id in profile_ids:
+        evict_mturk_clients(profile_id)
+    job.message = f'Expired the AWS keys of {len(profile_ids)} users.'
+
+
+def published_sessions(expired_since, after_id=0) -> List[Session]:
+    """published sessions that are open, or expired after [expired_since],
+    whose owner still has AWS keys
+    """
+    return list(
+        Session.objects.exclude(HITGroupId='')
+        .filter(
+            id__gt=after_id,
+            expiration__gt=expired_since,
+            site__profile__aws_secret_access_key__isnull=False,
+        )
+        .select_related('site__profile')
+        .order_by('id')
+    )
+
+
+def for_each_session(job: Job, sessions: List[Session], func):
+    """a failure only affects its session; we keep going with the others.
+    if a job that a user is waiting for (e.g. a payment) gets queued,
+    we stop, and queue a job that continues after it.
+    """
+    errors = {}
+    num_done = 0
+    job.set_progress(0, len(sessions))
+    for session in sessions:
+        if num_done and higher_priority_job_waiting(job):
+            enqueue(
+                job.name,
+                description=job.description,
+                priority=job.priority,
+                after_id=sessions[num_done - 1].id,
+            )
+            break
+        mturk_client = get_mturk_client(
+            session.site.profile, use_sandbox=session.use_sandbox
+        )
+        try:
+            func(mturk_client, session)
+        except Exception as e:
+            errors[session.code] = str(e)
+            logger.error(f'{job.name} failed for {session}: {e}')
+        num_done += 1
+        job.set_progress(num_done)
+    msg = f'Processed {num_done - len(errors)} sessions.'
+    if num_done < len(sessions):
+        msg += (
+            f' Stopped to let a more urgent job run;'
+            f' the other {len(sessions) - num_done} continue in a new job.'
+        )
+    for code, error in errors.items():
+        msg += f'\n{code}: {error}'
+    job.message = msg
+
+
+@periodic_task('mturk.sync_assignments', every=5 * 60)
+def sync_assignments(job: Job, after_id=0):
+    """so that the payments page rarely has anything left to fetch.
+    refresh_assignments skips the HITs that can't have changed.
+    """
+    sessions = published_sessions(time.time() - SYNC_AFTER_EXPIRATION, after_id)
+    for_each_session(job, sessions, refresh_assignments)
+
+
+def refresh_expiration(mturk_client, session: Session):
+    hit_ids = list(HIT.objects.filter(session=session).values_list('hit_id', flat=True))
+    limiter = AdaptiveLimiter(MAX_CONCURRENT_CALLS)
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS) as executor:
+        hits = executor.map(
+            lambda hit_id: limiter.call(mturk_client.get_hit, HITId=hit_id)['HIT'],
+            hit_ids,
+        )
+        # the HIT group stays open as long as any of its HITs does
+        expiration = max((hit['Expiration'].timestamp() for hit in hits), default=None)
+    if expiration is None:
+        return
+    now = time.time()
+    if expiration < now:
+        # MTurk reports the past date it was expired to (see EXPIRE_NOW),
+        # so like expire_hits, we record when we found out.
+        if session.expiration < now:
+            return
+        expiration = now
+    if expiration != session.expiration:
+        session.expiration = expiration
+        session.save(update_fields=['expiration'])
+
+
+@periodic_task('mturk.refresh_hit_expirations', every=30 * 60)
+def refresh_hit_expirations(job: Job, after_id=0):
+    sessions = published_sessions(time.time() - EXPIRATION_CHECK_WINDOW, after_id)
+    for_each_session(job, sessions, refresh_expiration)
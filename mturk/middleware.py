@@ -1,3 +1,5 @@
+import asyncio
+
 import sentry_sdk
 from django.http import HttpResponse
 
@@ -5,13 +7,20 @@ from mturk.utils import MTurkError
 
 
 class ExceptionMiddleware:
+    sync_capable = True
+    async_capable = True
+
     def __init__(self, get_response):
         self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
 
     def __call__(self, request):
+        # in async mode, this returns the coroutine for Django to await
         response = self.get_response(request)
         return response
 
+    # Django calls this in both modes; it's always run as sync.
     def process_exception(self, request, exception):
         if isinstance(exception, MTurkError):
             sentry_sdk.capture_exception()
@@ -0,0 +1,14 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:27
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mturk', '0003_auto_20210622_0735'),
+        ('mturk', '0003_auto_20210614_0923'),
+    ]
+
+    operations = [
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mturk', '0004_merge_20261018_0627'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hit',
+            name='last_synced',
+            field=models.FloatField(null=True),
+        ),
+        migrations.AlterUniqueTogether(
+            name='hitworker',
+            unique_together={('session', 'worker_id')},
+        ),
+        migrations.CreateModel(
+            name='Assignment',
+            fields=[
+                ('assignment_id', models.CharField(max_length=255, primary_key=True, serialize=False)),
+                ('worker_id', models.CharField(max_length=255)),
+                ('status', models.CharField(max_length=20)),
+                ('submit_time', models.DateTimeField()),
+                ('completion_code', models.CharField(blank=True, default='', max_length=255)),
+                ('hit', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mturk.hit')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mturk.session')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
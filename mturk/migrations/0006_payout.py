@@ -0,0 +1,32 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:30
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hr', '0008_job'),
+        ('mturk', '0005_auto_20261018_0627'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payout',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('assignment_id', models.CharField(max_length=255)),
+                ('bonus', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('bonus_sent', models.BooleanField(default=False)),
+                ('status', models.CharField(default='pending', max_length=20)),
+                ('error', models.TextField(default='')),
+                ('hitworker', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mturk.hitworker')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='hr.job')),
+                ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='mturk.session')),
+            ],
+            options={
+                'unique_together': {('job', 'assignment_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mturk', '0006_payout'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='assignment',
+            name='reject_requested',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mturk', '0007_assignment_reject_requested'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hit',
+            name='batch_index',
+            field=models.IntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mturk', '0008_hit_batch_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='code',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='assignment',
+            index=models.Index(fields=['session', 'submit_time'], name='mturk_assig_session_f7cb8b_idx'),
+        ),
+    ]
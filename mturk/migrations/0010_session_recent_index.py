@@ -0,0 +1,17 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mturk', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='session',
+            index=models.Index(fields=['site', '-id'], name='mturk_session_recent'),
+        ),
+    ]
@@ -1,9 +1,11 @@
 import time
+from typing import List
 
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.db import models
 
-from hr.models import BaseModel, BaseSession
+from hr.models import BaseModel, BaseSession, Job
 
 
 class Session(BaseSession):
@@ -13,6 +15,9 @@ class Session(BaseSession):
     HITGroupId = models.CharField(default='', max_length=255)
     question_template = models.TextField()
 
+    # readable_status() and the sandbox column need these
+    list_fields = BaseSession.list_fields + ['use_sandbox', 'expiration', 'HITGroupId']
+
     def worker_url(self):
         # different HITs
         # get the same preview page, because they are lumped into the same
@@ -52,12 +57,26 @@ class Session(BaseSession):
             return 'Expired'
         return 'Unpublished'
 
+    def submissions_close_at(self) -> float:
+        """after the HIT expires, workers who already accepted an assignment
+        can still submit it until their allotted time runs out.
+        """
+        minutes = self.config['mturk_hit_settings']['minutes_allotted_per_assignment']
+        return self.expiration + 60 * minutes
+
 
 class HIT(BaseModel):
     hit_id = models.CharField(max_length=255, primary_key=True)
     HITGroupId = models.CharField(max_length=255)
     session: Session = models.ForeignKey(Session, on_delete=models.CASCADE)
     max_assignments = models.IntegerField()
+    # which microbatch of the session this is. it determines the HIT's
+    # UniqueRequestToken, and lets an interrupted publish be resumed.
+    # see create_hits
+    batch_index = models.IntegerField(null=True)
+    # timestamp of when we last copied this HIT's assignments from MTurk.
+    # see refresh_assignments
+    last_synced = models.FloatField(null=True)
 
 
 class HITWorker(BaseModel):
@@ -73,3 +92,122 @@ class HITWorker(BaseModel):
     session: Session = models.ForeignKey(Session, on_delete=models.CASCADE)
     # we don't associate it with a HIT because we only receive assignment_id and worker_id
     # from incoming mturk requests
+
+    @classmethod
+    def _redirect_cache_key(cls, session_id, worker_id):
+        return f'hitworker:{session_id}:{worker_id}'
+
+    @classmethod
+    def record_arrival(cls, session_id, worker_id, assignment_id) -> str:
+        """returns the assignment_id the worker first arrived with.
+        workers often click the link more than once (e.g. reloading the HIT),
+        so we remember them in-process rather than querying every time.
+        """
+        cache = caches['redirects']
+        key = cls._redirect_cache_key(session_id, worker_id)
+        recorded_assignment_id = cache.get(key)
+        if recorded_assignment_id is None:
+            # not write-behind like prolific's Worker: if a worker starts
+            # 2 assignments at about the same time (e.g. on different dynos),
+            # only the unique constraint can tell us which one to reject.
+            worker, _ = cls.insert_or_get(
+                ['session_id', 'worker_id'],
+                worker_id=worker_id,
+                session_id=session_id,
+                assignment_id=assignment_id,
+            )
+            recorded_assignment_id = worker['assignment_id']
+            cache.set(key, recorded_assignment_id)
+        return recorded_assignment_id
+
+    def clear_redirect_cache(self):
+        caches['redirects'].delete(
+            self._redirect_cache_key(self.session_id, self.worker_id)
+        )
+
+
+class Assignment(BaseModel):
+    """Local copy of a submitted/approved/rejected MTurk assignment,
+    so the payments page doesn't have to download all of them on every page view.
+    Kept up to date by refresh_assignments.
+    """
+
+    class Meta:
+        indexes = [
+            # first_per_worker reads a session's assignments in this order
+            models.Index(fields=['session', 'submit_time']),
+        ]
+
+    assignment_id = models.CharField(max_length=255, primary_key=True)
+    hit: HIT = models.ForeignKey(HIT, on_delete=models.CASCADE)
+    # denormalized from HIT, since we almost always query by session
+    session: Session = models.ForeignKey(Session, on_delete=models.CASCADE)
+    worker_id = models.CharField(max_length=255)
+    # 'Submitted', 'Approved' or 'Rejected'
+    status = models.CharField(max_length=20)
+    submit_time = models.DateTimeField()
+    # extracted from the Answer XML, which we don't store
+    completion_code = models.CharField(max_length=255, blank=True, default='')
+    # a reject job has been queued for it, so we shouldn't queue another one,
+    # or pay it. see mturk.jobs.enqueue_rejections
+    reject_requested = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f'Assignment:{self.assignment_id}'
+
+    def is_unreviewed(self):
+        return self.status == 'Submitted' and not self.reject_requested
+
+    @classmethod
+    def first_per_worker(cls, session) -> List['Assignment']:
+        # with micro-batching, a worker can accept the HIT multiple times,
+        # and therefore can submit it multiple times.
+        # here, we only accept their first submission.
+        # there should be no way for them to submit twice, since our redirect code
+        # will block them for participating in a second assignment. so if they submit
+        # twice, we are within our rights to filter it out.
+        # our auto-reject code will reject them, but we should still filter them out,
+        # to avoid weird edge cases, like being in workers_not_reviewed and
+        # workers_accepted at the same time (perhaps mturk has a delay before it marks
+        # a worker as rejected).
+        # i got someone in participants_rejected and participants_accepted,
+        # first by submitting without clicking the link (and getting auto-rejected)
+        # then by submitting and getting approved.
+        assignments = {}
+        for a in cls.objects.filter(session=session).order_by('submit_time'):
+            assignments.setdefault(a.worker_id, a)
+        return list(assignments.values())
+
+    @classmethod
+    def set_status(cls, assignment_ids, status):
+        """after we approve/reject on MTurk, so the change shows up
+        without waiting for the next refresh.
+        """
+        cls.objects.filter(assignment_id__in=assignment_ids).update(status=status)
+
+
+class Payout(BaseModel):
+    """The outcome of paying one worker (bonus + approval) in a payment job.
+    see mturk.jobs.pay_workers
+    """
+
+    class Meta:
+        unique_together = ['job', 'assignment_id']
+
+    PENDING = 'pending'
+    PAID = 'paid'
+    FAILED = 'failed'
+
+    job: Job = models.ForeignKey(Job, on_delete=models.CASCADE)
+    session: Session = models.ForeignKey(Session, on_delete=models.CASCADE)
+    hitworker: HITWorker = models.ForeignKey(HITWorker, on_delete=models.CASCADE)
+    assignment_id = models.CharField(max_length=255)
+    bonus = models.DecimalField(max_digits=10, decimal_places=2)
+    # so that when a payment is retried (in a new job, or after the worker crashed),
+    # we don't send the bonus again.
+    bonus_sent = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, default=PENDING)
+    error = models.TextField(default='')
+
+    def __str__(self):
+        return f'Payout:{self.assignment_id}'
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from hr.models import Profile
+from .models import Session, HITWorker
+from .utils import evict_mturk_clients
+
+
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+def clear_session_redirect_cache(sender, instance, **kwargs):
+    instance.clear_redirect_cache()
+
+
+@receiver(post_save, sender=HITWorker)
+@receiver(post_delete, sender=HITWorker)
+def clear_worker_redirect_cache(sender, instance, **kwargs):
+    instance.clear_redirect_cache()
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def evict_profile_mturk_clients(sender, instance, **kwargs):
+    # e.g. the AWS keys were changed in Settings
+    evict_mturk_clients(instance.id)
@@ -1,14 +1,32 @@
+import asyncio
+import hashlib
 import logging
+import queue
 import contextlib
+import enum
 import json
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict, namedtuple
 from dataclasses import dataclass
-from typing import List, Dict, Union, Optional
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from django.http import Http404
 import boto3
+import botocore.config
+import botocore.exceptions
+from asgiref.sync import sync_to_async
 from django.conf import settings
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import F
+from hr import metrics
 from hr.models import Profile
+from .models import HIT, Assignment
+from otree_api import BaseOTreeApiError
 
 logger = logging.getLogger(__name__)
 
@@ -26,19 +44,72 @@ class MTurkSettings:
     grant_qualification_id: Optional[str] = None
 
 
+# same as botocore's default max_pool_connections.
+# concurrent calls beyond this would have to open extra connections.
+MAX_CONCURRENT_CALLS = 10
+
+# creating a boto3 client is slow (it loads the service model, resolves credentials
+# and sets up a new connection pool), but clients are thread-safe,
+# so we keep one per set of credentials and reuse it across requests.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _keys_fingerprint(profile: Profile) -> str:
+    # so that we don't keep the secret itself in the dict key,
+    # and so that a client made with old keys is never reused.
+    keys = f'{profile.aws_access_key_id}:{profile.aws_secret_access_key}'
+    return hashlib.sha256(keys.encode('utf8')).hexdigest()
+
+
 def get_mturk_client(profile: Profile, *, use_sandbox=True):
-    if use_sandbox:
+    fingerprint = _keys_fingerprint(profile)
+    pool_key = (profile.id, bool(use_sandbox), fingerprint)
+    client = _clients.get(pool_key)
+    if client:
+        return client
+    with _clients_lock:
+        if pool_key not in _clients:
+            # clients made with this profile's previous keys are no longer usable.
+            for stale_key in [
+                k for k in _clients if k[0] == profile.id and k[2] != fingerprint
+            ]:
+                del _clients[stale_key]
+            _clients[pool_key] = _make_mturk_client(profile, use_sandbox=use_sandbox)
+        return _clients[pool_key]
+
+
+def _make_mturk_client(profile: Profile, *, use_sandbox):
+    if settings.MTURK_ENDPOINT_URL:
+        # e.g. benchmarks.fake_mturk
+        endpoint_url = settings.MTURK_ENDPOINT_URL
+    elif use_sandbox:
         endpoint_url = 'https://mturk-requester-sandbox.us-east-1.amazonaws.com'
     else:
         endpoint_url = 'https://mturk-requester.us-east-1.amazonaws.com'
-    return boto3.client(
+    # boto3.client() uses a shared default session, which is not thread-safe.
+    client = boto3.session.Session().client(
         'mturk',
         aws_access_key_id=profile.aws_access_key_id,
         aws_secret_access_key=profile.aws_secret_access_key,
         endpoint_url=endpoint_url,
         # if I specify endpoint_url without region_name, it complains
         region_name='us-east-1',
+        config=botocore.config.Config(
+            max_pool_connections=max(
+                MAX_CONCURRENT_CALLS, settings.MTURK_PAYOUT_CONCURRENCY
+            )
+        ),
     )
+    metrics.instrument_mturk_client(client, use_sandbox=use_sandbox)
+    return client
+
+
+def evict_mturk_clients(profile_id):
+    """call this when a profile's AWS keys change or are deleted"""
+    with _clients_lock:
+        for pool_key in [k for k in _clients if k[0] == profile_id]:
+            del _clients[pool_key]
 
 
 class MTurkError(Exception):
@@ -60,87 +131,649 @@ def MTurkClient(profile, *, use_sandbox=True, request):
         raise MTurkError from exc
 
 
-AssignmentData = namedtuple(
-    'Assignment', ['worker_id', 'assignment_id', 'status', 'answer', 'submit_time']
-)
+class AsyncMTurk:
+    '''Makes every operation of a boto3 MTurk client awaitable.
+    boto3 has no asyncio support, so each call runs in a worker thread
+    (boto3 clients are thread-safe), which lets calls overlap.
+    '''
+
+    def __init__(self, mturk_client):
+        # blocking; only for code that already runs in a worker thread,
+        # like apply_to_hits and the assignment iterators.
+        self.client = mturk_client
 
+    def __getattr__(self, name):
+        return sync_to_async(getattr(self.client, name), thread_sensitive=False)
 
-def get_all_assignments(mturk_client, hit_ids) -> List[AssignmentData]:
-    # Accumulate all relevant assignments, one page of results at
-    # a time.
-    assignments = []
 
-    for hit_id in hit_ids:
-        args = dict(
-            HITId=hit_id,
-            # i think 100 is the max page size
-            MaxResults=100,
-            AssignmentStatuses=['Submitted', 'Approved', 'Rejected'],
+@contextlib.asynccontextmanager
+async def AsyncMTurkClient(profile, *, use_sandbox=True, request):
+    '''async version of MTurkClient'''
+    try:
+        # making a new client loads botocore's service model, which takes a while
+        mturk_client = await sync_to_async(get_mturk_client, thread_sensitive=False)(
+            profile, use_sandbox=use_sandbox
         )
+        yield AsyncMTurk(mturk_client)
+    except BaseOTreeApiError:
+        # oTree calls are often gathered together with MTurk calls,
+        # and ExperimenterMixin should report those.
+        raise
+    except Exception as exc:
+        raise MTurkError from exc
+
+
+async def gather_bounded(aws, limit=MAX_CONCURRENT_CALLS) -> list:
+    '''like asyncio.gather, but with at most [limit] awaitables running at once'''
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(aw):
+        async with semaphore:
+            return await aw
 
-        while True:
-            response = mturk_client.list_assignments_for_hit(**args)
-            if not response['Assignments']:
-                break
-            for d in response['Assignments']:
-                assignments.append(
-                    AssignmentData(
-                        worker_id=d['WorkerId'],
-                        assignment_id=d['AssignmentId'],
-                        status=d['AssignmentStatus'],
-                        answer=d['Answer'],
-                        submit_time=d['SubmitTime'],
+    return await asyncio.gather(*[run(aw) for aw in aws])
+
+
+class AssignmentStatus(str, enum.Enum):
+    # the values are MTurk's, which is also what Assignment.status stores
+    Submitted = 'Submitted'
+    Approved = 'Approved'
+    Rejected = 'Rejected'
+
+
+class AssignmentData:
+    """An assignment as returned by ListAssignmentsForHIT, minus the Answer XML.
+    A large session has thousands of these, and the XML can be many KB each,
+    even though all we need from it is the completion code.
+    So it's parsed right away, and only the code is kept.
+    """
+
+    __slots__ = ['worker_id', 'assignment_id', 'status', 'submit_time', 'completion_code']
+
+    def __init__(
+        self,
+        worker_id: str,
+        assignment_id: str,
+        status: AssignmentStatus,
+        submit_time: int,
+        completion_code: str,
+    ):
+        self.worker_id = worker_id
+        self.assignment_id = assignment_id
+        self.status = status
+        # unix time in seconds
+        self.submit_time = submit_time
+        self.completion_code = completion_code
+
+    def __repr__(self):
+        return f'AssignmentData({self.assignment_id}, {self.worker_id}, {self.status.value})'
+
+    @classmethod
+    def from_mturk(cls, d: dict) -> 'AssignmentData':
+        return cls(
+            worker_id=d['WorkerId'],
+            assignment_id=d['AssignmentId'],
+            status=AssignmentStatus(d['AssignmentStatus']),
+            submit_time=int(d['SubmitTime'].timestamp()),
+            completion_code=get_completion_code(d['Answer']),
+        )
+
+    def submit_datetime(self) -> datetime:
+        return datetime.fromtimestamp(self.submit_time, timezone.utc)
+
+
+# error codes MTurk/AWS use when we exceed the request rate
+THROTTLING_ERROR_CODES = {
+    'ThrottlingException',
+    'Throttling',
+    'TooManyRequestsException',
+    'RequestLimitExceeded',
+}
+
+
+def is_throttling_error(exc: Exception) -> bool:
+    return (
+        isinstance(exc, botocore.exceptions.ClientError)
+        and exc.response.get('Error', {}).get('Code') in THROTTLING_ERROR_CODES
+    )
+
+
+def call_with_backoff(operation, *, max_attempts=6, **kwargs):
+    """botocore retries throttled calls a few times on its own, but when we have
+    many calls in flight, they tend to use up those retries together.
+    so we keep backing off (with jitter, so they spread out).
+    """
+    for attempt in range(max_attempts):
+        try:
+            return operation(**kwargs)
+        except Exception as exc:
+            if not is_throttling_error(exc) or attempt == max_attempts - 1:
+                raise
+            delay = backoff_delay(attempt)
+            logger.info(f'MTurk is throttling us; retrying in {delay:.1f}s')
+            time.sleep(delay)
+
+
+def backoff_delay(attempt) -> float:
+    return min(0.5 * 2 ** attempt, 10) * random.uniform(0.5, 1.5)
+
+
+class AdaptiveLimiter:
+    """Limits how many MTurk calls are in flight across threads.
+    When MTurk throttles a call, the limit is halved (down to 1),
+    and then it grows back by 1 after every [limit] successful calls,
+    up to max_concurrency (like TCP congestion control).
+    """
+
+    def __init__(self, max_concurrency):
+        self.max_concurrency = max_concurrency
+        self.limit = max_concurrency
+        self._in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+
+    def call(self, operation, *, max_attempts=6, **kwargs):
+        """like call_with_backoff, but also adjusts the limit"""
+        for attempt in range(max_attempts):
+            with self._condition:
+                while self._in_flight >= self.limit:
+                    self._condition.wait()
+                self._in_flight += 1
+            throttled = False
+            try:
+                return operation(**kwargs)
+            except Exception as exc:
+                throttled = is_throttling_error(exc)
+                if not throttled or attempt == max_attempts - 1:
+                    raise
+            finally:
+                self._release(throttled)
+            delay = backoff_delay(attempt)
+            logger.info(
+                f'MTurk is throttling us; lowered concurrency to {self.limit}, '
+                f'retrying in {delay:.1f}s'
+            )
+            time.sleep(delay)
+
+    def _release(self, throttled):
+        with self._condition:
+            self._in_flight -= 1
+            if throttled:
+                self.limit = max(1, self.limit // 2)
+                self._successes = 0
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.max_concurrency:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+# MTurk HIT IDs are 30 uppercase letters and digits
+HIT_ID_PATTERN = re.compile(r'\b[0-9A-Z]{30}\b')
+
+
+def is_duplicate_request_error(exc: Exception) -> bool:
+    """MTurk's answer to a UniqueRequestToken it has already seen
+    (AWS.MechanicalTurk.HitAlreadyExists)
+    """
+    if not isinstance(exc, botocore.exceptions.ClientError):
+        return False
+    error = exc.response.get('Error', {})
+    text = f"{error.get('Code', '')} {error.get('Message', '')}"
+    return 'AlreadyExists' in text or 'already been used' in text
+
+
+def find_hit_by_token(mturk_client, exc, token) -> dict:
+    """the HIT that an earlier call with this UniqueRequestToken created.
+    MTurk puts its ID in the error message. if it's not there,
+    we look for the HIT whose RequesterAnnotation is the token.
+    """
+    match = HIT_ID_PATTERN.search(exc.response.get('Error', {}).get('Message', ''))
+    if match:
+        return call_with_backoff(mturk_client.get_hit, HITId=match.group())['HIT']
+    kwargs = dict(MaxResults=100)
+    while True:
+        response = call_with_backoff(mturk_client.list_hits, **kwargs)
+        for hit in response['HITs']:
+            if hit.get('RequesterAnnotation') == token:
+                return hit
+        if not response['HITs'] or not response.get('NextToken'):
+            raise exc
+        kwargs['NextToken'] = response['NextToken']
+
+
+def create_hits(mturk_client, session, hit_params: Dict[int, dict]) -> List[dict]:
+    """Creates the HITs of a session concurrently, keyed by batch index,
+    and saves each one as soon as it's created.
+    Batches that already have a HIT row are skipped, so if a publish fails partway
+    (even if the request is killed), submitting again only creates the missing ones.
+    A batch that MTurk created but we didn't get to save is recognized
+    by its UniqueRequestToken, and saved then.
+    If some batches fail, the others still go ahead,
+    and then the first error is raised.
+    Returns the MTurk HIT dicts that were created.
+    """
+    existing = set(
+        HIT.objects.filter(session=session, batch_index__isnull=False).values_list(
+            'batch_index', flat=True
+        )
+    )
+    limiter = AdaptiveLimiter(MAX_CONCURRENT_CALLS)
+
+    # runs in a worker thread, so no DB access here.
+    def create(params):
+        try:
+            return limiter.call(mturk_client.create_hit, **params)['HIT']
+        except Exception as exc:
+            if not is_duplicate_request_error(exc):
+                raise
+            return find_hit_by_token(mturk_client, exc, params['UniqueRequestToken'])
+
+    created = []
+    first_error = None
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS) as executor:
+        futures = {
+            executor.submit(create, params): i
+            for i, params in hit_params.items()
+            if i not in existing
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                hit = future.result()
+            except Exception as exc:
+                logger.error(f'Could not create HIT #{i}: {exc}')
+                first_error = first_error or exc
+                continue
+            # a concurrent submit of the same form may have saved it already
+            HIT.objects.bulk_create(
+                [
+                    HIT(
+                        hit_id=hit['HITId'],
+                        HITGroupId=hit['HITGroupId'],
+                        max_assignments=hit_params[i]['MaxAssignments'],
+                        session=session,
+                        batch_index=i,
                     )
+                ],
+                ignore_conflicts=True,
+            )
+            created.append(hit)
+    if first_error:
+        raise first_error
+    return created
+
+
+def iter_hit_assignment_pages(mturk_client, hit_id) -> Iterator[List[AssignmentData]]:
+    """the HIT's assignments, one page at a time.
+    the next page is only requested when the caller asks for it.
+    """
+    args = dict(
+        HITId=hit_id,
+        # i think 100 is the max page size
+        MaxResults=100,
+        AssignmentStatuses=['Submitted', 'Approved', 'Rejected'],
+    )
+
+    while True:
+        response = call_with_backoff(mturk_client.list_assignments_for_hit, **args)
+        if not response['Assignments']:
+            break
+        page = [AssignmentData.from_mturk(d) for d in response['Assignments']]
+        args['NextToken'] = response['NextToken']
+        # let the response (with all the Answer XML) go before we wait on the consumer
+        del response
+        yield page
+
+
+def iter_assignments(mturk_client, hit_ids) -> Iterator[Tuple[str, AssignmentData]]:
+    """(hit_id, assignment) for all assignments of these HITs, in no particular order.
+    with micro-batching, a session can have 100+ HITs,
+    so we fetch them concurrently rather than one after another.
+    pages are handed over through a small queue, so if the caller is slower
+    than MTurk, the fetching threads wait, rather than piling up pages.
+    """
+    pages = queue.Queue(maxsize=MAX_CONCURRENT_CALLS)
+    done = object()
+
+    def fetch(hit_id):
+        try:
+            for page in iter_hit_assignment_pages(mturk_client, hit_id):
+                pages.put((hit_id, page))
+        except Exception as exc:
+            pages.put((hit_id, exc))
+        else:
+            pages.put((hit_id, done))
+
+    with ThreadPoolExecutor(max_workers=MAX_CONCURRENT_CALLS) as executor:
+        futures = [executor.submit(fetch, hit_id) for hit_id in hit_ids]
+        try:
+            num_running = len(futures)
+            while num_running:
+                hit_id, page = pages.get()
+                if page is done:
+                    num_running -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    for assignment in page:
+                        yield hit_id, assignment
+        finally:
+            # if we stopped early, unblock the threads that are waiting
+            # to put a page, so that the executor can shut down.
+            for future in futures:
+                future.cancel()
+            while not all(future.done() for future in futures):
+                try:
+                    pages.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+
+
+# don't download a HIT's assignments again sooner than this (in seconds),
+# unless the user explicitly asks for a refresh.
+MIN_REFRESH_INTERVAL = 30
+
+
+def get_hits_to_refresh(session, *, force=False) -> List[HIT]:
+    """HITs whose assignments may have changed since we last copied them.
+    once the HIT can't receive submissions anymore and all its assignments
+    are reviewed, we don't need to ask MTurk about it again.
+    """
+    hits = HIT.filter(session=session)
+    if force or not hits:
+        return hits
+    now = time.time()
+    hit_ids_with_unreviewed = set(
+        Assignment.objects.filter(session=session, status='Submitted').values_list(
+            'hit_id', flat=True
+        )
+    )
+    if session.expiration is None:
+        # a publish that was interrupted before it saved the expiration.
+        # the HITs it created are open on MTurk.
+        submissions_close_at = float('inf')
+    else:
+        submissions_close_at = session.submissions_close_at()
+    hits_to_refresh = []
+    for hit in hits:
+        if hit.last_synced is None:
+            hits_to_refresh.append(hit)
+        elif now - hit.last_synced < MIN_REFRESH_INTERVAL:
+            continue
+        # the first condition also covers submissions that arrived
+        # between our last refresh and the closing time.
+        elif (
+            hit.last_synced < submissions_close_at
+            # these can be auto-approved, or reviewed on the MTurk website
+            or hit.hit_id in hit_ids_with_unreviewed
+        ):
+            hits_to_refresh.append(hit)
+    return hits_to_refresh
+
+
+def get_stored_statuses(hit_ids) -> Dict[str, str]:
+    return dict(
+        Assignment.objects.filter(hit_id__in=list(hit_ids)).values_list(
+            'assignment_id', 'status'
+        )
+    )
+
+
+def diff_assignments(
+    session,
+    assignments: Iterable[Tuple[str, AssignmentData]],
+    stored_statuses: Dict[str, str],
+) -> Tuple[List[Assignment], Dict[str, List[str]]]:
+    """compares what MTurk has with what we have, without touching the DB.
+    returns the new Assignment rows (unsaved), and the IDs of the assignments
+    whose status changed, by their new status.
+    it goes through the assignments as they come,
+    so it can consume iter_assignments as a stream.
+    """
+    new_assignments = []
+    status_changes = defaultdict(list)
+    for hit_id, data in assignments:
+        stored_status = stored_statuses.get(data.assignment_id)
+        if stored_status is None:
+            new_assignments.append(
+                Assignment(
+                    assignment_id=data.assignment_id,
+                    hit_id=hit_id,
+                    session=session,
+                    worker_id=data.worker_id,
+                    status=data.status.value,
+                    submit_time=data.submit_datetime(),
+                    completion_code=data.completion_code,
                 )
-            args['NextToken'] = response['NextToken']
-
-    # with micro-batching, a worker can accept the HIT multiple times,
-    # and therefore can submit it multiple times.
-    # here, we only accept their first submission.
-    # there should be no way for them to submit twice, since our redirect code
-    # will block them for participating in a second assignment. so if they submit
-    # twice, we are within our rights to filter it out.
-    # our auto-reject code will reject them, but we should still filter them out,
-    # to avoid weird edge cases, like being in workers_not_reviewed and
-    # workers_accepted at the same time (perhaps mturk has a delay before it marks
-    # a worker as rejected).
-    # i got someone in participants_rejected and participants_accepted,
-    # first by submitting without clicking the link (and getting auto-rejected)
-    # then by submitting and getting approved.
-    assignments.sort(key=lambda a: a.submit_time)
-    seen_worker_ids = set()
-    assignments_without_duplicates = []
-    for a in assignments:
-        if a.worker_id not in seen_worker_ids:
-            assignments_without_duplicates.append(a)
-            seen_worker_ids.add(a)
-    return assignments_without_duplicates
-
-
-def get_worker_ids_by_status(
-    all_assignments: List[AssignmentData],
-) -> Dict[str, List[str]]:
-    workers_by_status = defaultdict(list)
-    for assignment in all_assignments:
-        workers_by_status[assignment.status].append(assignment.worker_id)
-    return workers_by_status
+            )
+        elif stored_status != data.status.value:
+            status_changes[data.status.value].append(data.assignment_id)
+    return new_assignments, status_changes
+
+
+def save_refreshed_assignments(
+    hit_ids,
+    new_assignments: List[Assignment],
+    status_changes: Dict[str, List[str]],
+    synced_at: float,
+):
+    if not hit_ids:
+        return
+    with transaction.atomic():
+        # another request may be refreshing the same session at the same time.
+        Assignment.objects.bulk_create(new_assignments, ignore_conflicts=True)
+        for status, assignment_ids in status_changes.items():
+            Assignment.set_status(assignment_ids, status)
+        HIT.objects.filter(hit_id__in=list(hit_ids)).update(last_synced=synced_at)
+
+
+def refresh_assignments(mturk_client, session, *, force=False):
+    """copy new and changed assignments from MTurk to our Assignment table"""
+    hit_ids = [h.hit_id for h in get_hits_to_refresh(session, force=force)]
+    stored_statuses = get_stored_statuses(hit_ids)
+    # take the time before fetching, so that anything submitted
+    # while we are fetching gets picked up next time.
+    synced_at = time.time()
+    new_assignments, status_changes = diff_assignments(
+        session, iter_assignments(mturk_client, hit_ids), stored_statuses
+    )
+    save_refreshed_assignments(hit_ids, new_assignments, status_changes, synced_at)
+
+
+async def arefresh_assignments(mturk: AsyncMTurk, session, *, force=False):
+    # the DB work stays on the main thread; the MTurk calls
+    # (and parsing their results) run in worker threads.
+    hits = await sync_to_async(get_hits_to_refresh)(session, force=force)
+    hit_ids = [h.hit_id for h in hits]
+    stored_statuses = await sync_to_async(get_stored_statuses)(hit_ids)
+    synced_at = time.time()
+    new_assignments, status_changes = await sync_to_async(
+        lambda: diff_assignments(
+            session, iter_assignments(mturk.client, hit_ids), stored_statuses
+        ),
+        thread_sensitive=False,
+    )()
+    await sync_to_async(save_refreshed_assignments)(
+        hit_ids, new_assignments, status_changes, synced_at
+    )
+
+
+HITResult = namedtuple('HITResult', ['hit_id', 'error'])
+
+# If you update the expiration to a time in the past,
+# the HIT will be immediately expired.
+EXPIRE_NOW = datetime(2015, 1, 1)
+
+
+async def apply_to_hits(
+    mturk: AsyncMTurk, hits: List[HIT], operation: str, get_params
+) -> List[HITResult]:
+    """Calls an MTurk operation (e.g. 'update_expiration_for_hit') on every HIT
+    concurrently. get_params(hit) returns the operation's kwargs for that HIT.
+    If the call fails for a HIT, the others still go ahead,
+    and the error is in that HIT's result.
+    """
+    limiter = AdaptiveLimiter(MAX_CONCURRENT_CALLS)
+    method = getattr(mturk.client, operation)
+
+    def call(hit: HIT) -> HITResult:
+        try:
+            limiter.call(method, **get_params(hit))
+        except Exception as exc:
+            if is_duplicate_request_error(exc):
+                # an earlier call with this UniqueRequestToken succeeded,
+                # but we didn't get to record it.
+                return HITResult(hit.hit_id, '')
+            logger.error(f'{operation} failed for HIT {hit.hit_id}: {exc}')
+            return HITResult(hit.hit_id, str(exc))
+        return HITResult(hit.hit_id, '')
+
+    return await gather_bounded(
+        sync_to_async(call, thread_sensitive=False)(hit) for hit in hits
+    )
+
+
+def save_hit_results(
+    session, results: List[HITResult], *, expiration=None, num_added=0
+):
+    """Records the outcome of apply_to_hits in one transaction,
+    so that the session never reflects only part of an operation.
+    """
+    succeeded = [r.hit_id for r in results if not r.error]
+    if not succeeded:
+        return
+    with transaction.atomic():
+        if num_added:
+            HIT.objects.filter(hit_id__in=succeeded).update(
+                max_assignments=F('max_assignments') + num_added
+            )
+        if expiration is not None:
+            session.expiration = expiration
+            session.save(update_fields=['expiration'])
+
+
+async def expire_hits(mturk: AsyncMTurk, session) -> List[HITResult]:
+    hits = await sync_to_async(HIT.filter)(session=session)
+    results = await apply_to_hits(
+        mturk,
+        hits,
+        'update_expiration_for_hit',
+        lambda hit: dict(HITId=hit.hit_id, ExpireAt=EXPIRE_NOW),
+    )
+    # if some HITs are still open, the session isn't expired yet,
+    # and the user can try again.
+    if not any(r.error for r in results):
+        # not the 2015 date, because workers who already accepted
+        # can still submit until now + their allotted time.
+        # see Session.submissions_close_at
+        await sync_to_async(save_hit_results)(
+            session, results, expiration=time.time()
+        )
+    return results
+
+
+async def extend_hits(
+    mturk: AsyncMTurk, session, expire_at: datetime
+) -> List[HITResult]:
+    """also reopens HITs that already expired"""
+    hits = await sync_to_async(HIT.filter)(session=session)
+    results = await apply_to_hits(
+        mturk,
+        hits,
+        'update_expiration_for_hit',
+        lambda hit: dict(HITId=hit.hit_id, ExpireAt=expire_at),
+    )
+    # the HIT group stays open as long as any of its HITs does
+    await sync_to_async(save_hit_results)(
+        session, results, expiration=expire_at.timestamp()
+    )
+    return results
+
+
+async def add_assignments_to_hits(
+    mturk: AsyncMTurk, session, num_assignments: int
+) -> List[HITResult]:
+    """adds num_assignments to each HIT"""
+    hits = await sync_to_async(HIT.filter)(session=session)
+    results = await apply_to_hits(
+        mturk,
+        hits,
+        'create_additional_assignments_for_hit',
+        lambda hit: dict(
+            HITId=hit.hit_id,
+            NumberOfAdditionalAssignments=num_assignments,
+            # if we already made this exact call but didn't get to record it,
+            # MTurk rejects the retry as a duplicate, and apply_to_hits
+            # counts that as done.
+            UniqueRequestToken=f'otree_{hit.hit_id}_{hit.max_assignments}_{num_assignments}',
+        ),
+    )
+    await sync_to_async(save_hit_results)(session, results, num_added=num_assignments)
+    return results
+
+
+# how much of the Answer XML we parse at a time
+ANSWER_CHUNK_SIZE = 4096
 
 
 def get_completion_code(xml: str) -> str:
-    if not xml:
+    """extracts the completion code from an assignment's Answer XML.
+    it's called once per assignment, when we first save it (see Assignment.completion_code).
+    the answer can be large (e.g. free-text fields), so we avoid building the whole tree.
+    """
+    if not xml or 'taskAnswers' not in xml:
         return ''
     # move inside function because it adds 0.03s to startup time
     from xml.etree import ElementTree
 
-    root = ElementTree.fromstring(xml)
-    for ans in root:
-        if ans[0].text == 'taskAnswers':
-            answer_data = json.loads(ans[1].text)
-            try:
-                return answer_data[0]['completion_code']
-            except:
-                return ''
-    return ''
+    task_answers = _find_task_answers(xml, ElementTree)
+    # None if the FreeText element is empty
+    if not task_answers:
+        return ''
+    try:
+        answer_data = json.loads(task_answers)
+    except ValueError:
+        # e.g. a worker edited the hidden field. it shouldn't break
+        # syncing the rest of the session's assignments.
+        return ''
+    try:
+        return answer_data[0]['completion_code']
+    except:
+        return ''
+
+
+def _find_task_answers(xml: str, ElementTree) -> Optional[str]:
+    # MTurk's answers look like
+    # <Answer><QuestionIdentifier>taskAnswers</QuestionIdentifier><FreeText>...</FreeText></Answer>
+    # so usually we can cut out the FreeText element and only parse that.
+    pos = xml.find('<QuestionIdentifier>taskAnswers</QuestionIdentifier>')
+    if pos != -1:
+        start = xml.find('<FreeText>', pos)
+        end = xml.find('</FreeText>', start)
+        if start != -1 and end != -1 and xml.find('</Answer>', pos, start) == -1:
+            fragment = xml[start : end + len('</FreeText>')]
+            return ElementTree.fromstring(fragment).text
+
+    # otherwise (e.g. different whitespace or namespace prefixes),
+    # parse incrementally and stop at the taskAnswers field.
+    parser = ElementTree.XMLPullParser(['end'])
+    is_task_answers = False
+    for i in range(0, len(xml), ANSWER_CHUNK_SIZE):
+        parser.feed(xml[i : i + ANSWER_CHUNK_SIZE])
+        for _, elem in parser.read_events():
+            # strip the namespace
+            tag = elem.tag.rpartition('}')[2]
+            if tag == 'QuestionIdentifier':
+                is_task_answers = elem.text == 'taskAnswers'
+            elif tag == 'FreeText' and is_task_answers:
+                return elem.text
+            elif tag == 'Answer':
+                # we don't need the other answers, so don't keep them in memory
+                elem.clear()
+                is_task_answers = False
+    return None
 
 
 def in_public_domain(request):
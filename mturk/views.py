@@ -1,33 +1,42 @@
+import asyncio
 import json
 import logging
-from datetime import datetime
-from decimal import Decimal
+from collections import defaultdict
 from typing import List
 
 import vanilla
+from asgiref.sync import sync_to_async
 from django import forms
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import F, Max, OuterRef, Subquery
 from django.http import HttpResponseForbidden, HttpResponseRedirect, HttpResponse
 from django.shortcuts import redirect, get_object_or_404
 from django.shortcuts import render
 from django.template.loader import render_to_string
 from django.urls import reverse
 
-from hr.models import Site
-from hr.views import ExperimenterMixin
+from hr import metrics
+from hr.export import export_response, iter_queryset
+from hr.jobs import enqueue
+from hr.models import Site, Job, job_subject
+from hr.views import ExperimenterMixin, AsyncExperimenterMixin
 from otree_api import GET
-from .models import HIT, Session, HITWorker
+from .models import HIT, Session, HITWorker, Assignment, Payout
 from .utils import (
     MTurkSettings,
-    get_all_assignments,
-    get_mturk_client,
-    get_completion_code,
-    get_worker_ids_by_status,
+    arefresh_assignments,
+    create_hits,
+    expire_hits,
+    extend_hits,
+    add_assignments_to_hits,
+    HITResult,
     MTurkClient,
+    AsyncMTurkClient,
     in_public_domain,
 )
-from .forms import CreateHITForm
-from tasks import expire_old_aws_keys
+from .forms import CreateHITForm, ExtendHITForm, AddAssignmentsForm
+from .jobs import enqueue_rejections
 
 
 logger = logging.getLogger(__name__)
@@ -35,27 +44,24 @@ logger = logging.getLogger(__name__)
 
 class RedirectMTurk(vanilla.View):
     def get(self, request, id):
-        session = Session.get_or_404(id=id)
+        # this view gets a burst of traffic when the HIT is published,
+        # so in the common case it runs without any DB queries.
+        # see Session.get_session_wide_url and HITWorker.record_arrival.
+        session_wide_url = Session.get_session_wide_url(id)
 
         assignment_id = request.GET['assignmentId']
         worker_id = request.GET['workerId']
-        worker, _ = HITWorker.objects.get_or_create(
-            worker_id=worker_id,
-            session=session,
-            defaults=dict(assignment_id=assignment_id),
+        recorded_assignment_id = HITWorker.record_arrival(
+            session_id=id, worker_id=worker_id, assignment_id=assignment_id
         )
-        if worker.assignment_id != assignment_id:
+        if recorded_assignment_id != assignment_id:
             return HttpResponse(
                 "Please return the assignment. Our records show that you have participated in a similar HIT before."
             )
 
-        session_wide_url = session.session_wide_url
-
-        # maybe the cause of this issue? https://github.com/oTree-org/HR/issues/2
-        if not session_wide_url.endswith('/'):
-            session_wide_url += '/'
+        metrics.redirects.inc(app='mturk')
         return HttpResponseRedirect(
-            session.session_wide_url + '?participant_label=' + worker_id
+            session_wide_url + '?participant_label=' + worker_id
         )
 
 
@@ -68,8 +74,16 @@ class MTurkSessions(ExperimenterMixin, vanilla.CreateView):
         site_id = self.kwargs['site_id']
         profile = self.profile
         site = Site.get_or_404(id=site_id, profile=profile)
-        sessions = Session.objects.filter(site_id=site_id).order_by('-id')
-        return dict(sessions=sessions, site=site, profile=profile)
+        before = self.request.GET.get('before', '')
+        before_id = int(before) if before.isdigit() else None
+        sessions, next_before_id = Session.page_for_site(site_id, before_id=before_id)
+        return dict(
+            sessions=sessions,
+            site=site,
+            profile=profile,
+            next_before_id=next_before_id,
+            is_first_page=before_id is None,
+        )
 
     def post(self, request, site_id):
         profile = self.profile
@@ -167,46 +181,61 @@ class CreateHIT(ExperimenterMixin, SessionMixin, vanilla.FormView):
         if remainder > 0:
             batch_sizes.append(remainder)
 
+        hit_params = {}
+        for i, batch_size in enumerate(batch_sizes):
+            mturk_hit_parameters = {
+                'Title': mturk_settings.title,
+                'Description': mturk_settings.description,
+                'Keywords': keywords,
+                'MaxAssignments': batch_size,
+                'Reward': str(session.config['participation_fee']),
+                'AssignmentDurationInSeconds': 60
+                * mturk_settings.minutes_allotted_per_assignment,
+                'LifetimeInSeconds': int(60 * 60 * mturk_settings.expiration_hours),
+                'UniqueRequestToken': f'otree_{session.code}_{i}',
+                # so that create_hits can find the HIT if the token was already used
+                'RequesterAnnotation': f'otree_{session.code}_{i}',
+                'Question': html_question,
+            }
+
+            if not use_sandbox:
+                # drop requirements checks in sandbox mode.
+                mturk_hit_parameters[
+                    'QualificationRequirements'
+                ] = mturk_settings.qualification_requirements
+            hit_params[i] = mturk_hit_parameters
+
+        if session.use_sandbox != use_sandbox:
+            # HITs left over from an interrupted publish are live in the other
+            # environment, and workers may already be doing them,
+            # so we can't just forget about them.
+            if HIT.objects.filter(session=session).exists():
+                env = 'sandbox' if session.use_sandbox else 'live'
+                messages.error(
+                    request,
+                    f'Some HITs were already created in {env} mode. '
+                    f'Publish again in {env} mode to finish creating them.',
+                )
+                return redirect('CreateHIT', code=session.code)
+            session.use_sandbox = use_sandbox
+            session.save(update_fields=['use_sandbox'])
+
         with MTurkClient(
             self.profile, use_sandbox=use_sandbox, request=request
         ) as mturk_client:
-
-            for i, batch_size in enumerate(batch_sizes):
-                mturk_hit_parameters = {
-                    'Title': mturk_settings.title,
-                    'Description': mturk_settings.description,
-                    'Keywords': keywords,
-                    'MaxAssignments': batch_size,
-                    'Reward': str(session.config['participation_fee']),
-                    'AssignmentDurationInSeconds': 60
-                    * mturk_settings.minutes_allotted_per_assignment,
-                    'LifetimeInSeconds': int(60 * 60 * mturk_settings.expiration_hours),
-                    'UniqueRequestToken': f'otree_{session.code}_{i}',
-                    'Question': html_question,
-                }
-
-                if not use_sandbox:
-                    # drop requirements checks in sandbox mode.
-                    mturk_hit_parameters[
-                        'QualificationRequirements'
-                    ] = mturk_settings.qualification_requirements
-
-                hit = mturk_client.create_hit(**mturk_hit_parameters)['HIT']
-
-                HITGroupId = hit['HITGroupId']
-                HIT.objects.create(
-                    hit_id=hit['HITId'],
-                    HITGroupId=HITGroupId,
-                    max_assignments=batch_size,
-                    session=session,
-                )
-            session.use_sandbox = use_sandbox
+            # if this fails partway, the user can submit the form again
+            # and it will pick up where it left off.
+            hits = create_hits(mturk_client, session, hit_params)
+            if not hits:
+                # every batch was created by an earlier attempt
+                hit_id = HIT.objects.filter(session=session).values_list(
+                    'hit_id', flat=True
+                )[0]
+                hits = [mturk_client.get_hit(HITId=hit_id)['HIT']]
+            hit = hits[0]
             session.expiration = hit['Expiration'].timestamp()
-            session.HITGroupId = HITGroupId
+            session.HITGroupId = hit['HITGroupId']
             session.save()
-
-        # for now we don't need a task queue
-        expire_old_aws_keys()
         return redirect('ManageHIT', session.code)
 
 
@@ -221,116 +250,164 @@ class ManageHIT(ExperimenterMixin, SessionMixin, vanilla.TemplateView):
 
     def get_context_data(self, **kwargs):
         session = self.session
+        jobs = Job.objects.filter(subject=job_subject(session)).order_by('-id')[:5]
         return dict(
             is_expired=session.is_expired(),
             is_active=session.is_active(),
             session=session,
+            jobs=jobs,
+            jobs_active=any(job.is_active() for job in jobs),
+            extend_form=ExtendHITForm(),
+            add_assignments_form=AddAssignmentsForm(),
         )
 
 
-class ExpireHIT(ExperimenterMixin, vanilla.View):
+def report_hit_results(request, results: List[HITResult], done_msg=None):
+    failed = [r for r in results if r.error]
+    num_succeeded = len(results) - len(failed)
+    if num_succeeded and done_msg:
+        messages.success(request, done_msg.format(num_succeeded))
+    for r in failed:
+        messages.error(request, f'HIT {r.hit_id}: {r.error}')
+
+
+class ExpireHIT(AsyncExperimenterMixin, vanilla.View):
     """only POST"""
 
-    def post(self, request, code):
-        session = Session.get_or_404(code=code)
+    async def post(self, request, code):
+        session = await sync_to_async(Session.get_or_404)(code=code)
 
-        with MTurkClient(
+        async with AsyncMTurkClient(
             self.profile, use_sandbox=session.use_sandbox, request=request
-        ) as mturk_client:
-            expiration = datetime(2015, 1, 1)
-            for hit in HIT.filter(session=session):
-                mturk_client.update_expiration_for_hit(
-                    HITId=hit.hit_id,
-                    # If you update it to a time in the past,
-                    # the HIT will be immediately expired.
-                    ExpireAt=expiration,
-                )
-            session.expiration = expiration.timestamp()
-            session.save()
-        # don't need a message because the MTurkCreateHIT page will
+        ) as mturk:
+            results = await expire_hits(mturk, session)
+        # no success message, because the MTurkCreateHIT page will
         # statically say the HIT has expired.
+        report_hit_results(request, results)
         return redirect('CreateHIT', code=code)
 
 
-class MTurkPayments(ExperimenterMixin, SessionMixin, vanilla.TemplateView):
-    template_name = 'mturk/MTurkPayments.html'
+class ExtendHIT(AsyncExperimenterMixin, vanilla.View):
+    """only POST"""
 
-    def get(self, request, code):
-        session = self.session
+    async def post(self, request, code):
+        session = await sync_to_async(Session.get_or_404)(code=code)
+        form = ExtendHITForm(request.POST)
+        if not form.is_valid():
+            messages.error(request, form.errors.as_text())
+            return redirect('ManageHIT', code=code)
 
-        workers_in_otree_hr = HITWorker.filter(session=session)
+        async with AsyncMTurkClient(
+            self.profile, use_sandbox=session.use_sandbox, request=request
+        ) as mturk:
+            results = await extend_hits(
+                mturk, session, form.cleaned_data['expiration']
+            )
+        report_hit_results(request, results, 'Changed the expiration of {} HITs')
+        return redirect('ManageHIT', code=code)
 
-        site = session.site
-        data = site.call_api(
-            GET,
-            'sessions',
-            session.code,
-            participant_labels=[wrk.worker_id for wrk in workers_in_otree_hr],
-        )
-        otree_pps_by_label = {p['label']: p for p in data['participants']}
 
-        with MTurkClient(
-            self.profile, use_sandbox=session.use_sandbox, request=self.request
-        ) as mturk_client:
-            raw_assignments = get_all_assignments(
-                mturk_client, [h.hit_id for h in HIT.filter(session=session)]
+class AddAssignments(AsyncExperimenterMixin, vanilla.View):
+    """only POST"""
+
+    async def post(self, request, code):
+        session = await sync_to_async(Session.get_or_404)(code=code)
+        largest_hit = await sync_to_async(
+            lambda: HIT.objects.filter(session=session).aggregate(
+                largest=Max('max_assignments')
+            )['largest']
+        )()
+        form = AddAssignmentsForm(request.POST, largest_hit=largest_hit)
+        if not form.is_valid():
+            messages.error(request, form.errors.as_text())
+            return redirect('ManageHIT', code=code)
+
+        async with AsyncMTurkClient(
+            self.profile, use_sandbox=session.use_sandbox, request=request
+        ) as mturk:
+            results = await add_assignments_to_hits(
+                mturk, session, form.cleaned_data['num_assignments']
             )
-            assignments = []
-            auto_rejected_assignment_ids = []
-
-            # auto-reject participants who submitted without clicking the link,
-            # since MTurk will auto-approve them if we don't reject.
-            # this also includes people who tried to participate twice,
-            # since our redirect code won't create an extra HitWorker if there is already
-            # someone with the same worker_id in the session.
-
-            for a in raw_assignments:
-                # better to refer to oTree DB rather than HR DB, because it's possible for
-                # someone to click the link to oTree HR but maybe the site is down.
-                # otree_pps_by_label is only the people in oTree AND oTree HR
-                if a.worker_id in otree_pps_by_label:
-                    assignments.append(a)
-                elif a.status == 'Submitted':
-                    auto_rejected_assignment_ids.append(a.assignment_id)
+        report_hit_results(request, results, 'Added assignments to {} HITs')
+        return redirect('ManageHIT', code=code)
 
-            for assignment_id in auto_rejected_assignment_ids:
-                mturk_client.reject_assignment(
-                    AssignmentId=assignment_id,
-                    RequesterFeedback='Auto-rejecting because this assignment was not found in our database.',
-                )
 
-        worker_ids_by_status = get_worker_ids_by_status(assignments)
+class MTurkPayments(AsyncExperimenterMixin, vanilla.TemplateView):
+    template_name = 'mturk/MTurkPayments.html'
 
-        def filter_workers_by_status(status) -> List[HITWorker]:
-            return HITWorker.filter(
-                worker_id__in=worker_ids_by_status[status], session=session
-            )
+    async def get(self, request, code):
+        session = await sync_to_async(Session.get_or_404)(code=code)
+        site = await sync_to_async(lambda: session.site)()
+        workers_in_otree_hr = await sync_to_async(HITWorker.filter)(session=session)
+        refresh = 'refresh' in request.GET
 
+        async with AsyncMTurkClient(
+            self.profile, use_sandbox=session.use_sandbox, request=self.request
+        ) as mturk:
+            # these are independent, so we wait for both at the same time.
+            # the MTurk side only downloads HITs that may have changed.
+            data, _ = await asyncio.gather(
+                site.aget_session_data(
+                    session.code,
+                    [wrk.worker_id for wrk in workers_in_otree_hr],
+                    fresh=refresh,
+                ),
+                arefresh_assignments(mturk, session, force=refresh),
+            )
         # if someone accepts twice, it's possible they could be in 2 lists.
         # So after we accept 1 assignment, they could be both in Approved and Submitted.
-        # this is why we filter in get_all_assignments
-        workers_approved = filter_workers_by_status('Approved')
-        workers_rejected = filter_workers_by_status('Rejected')
-        workers_not_reviewed = filter_workers_by_status('Submitted')
-
+        # this is why we only use each worker's first assignment.
+        raw_assignments = await sync_to_async(Assignment.first_per_worker)(session)
+        otree_pps_by_label = {p['label']: p for p in data['participants']}
+        workers_by_id = {wrk.worker_id: wrk for wrk in workers_in_otree_hr}
         participation_fee = session.config['participation_fee']
-        for lst in [
-            workers_not_reviewed,
-            workers_approved,
-            workers_rejected,
-        ]:
-            answers = {}
-            for assignment in assignments:
-                answers[assignment.worker_id] = assignment.answer
-            for wrk in lst:
-                participant = otree_pps_by_label[wrk.worker_id]
-                # these are not DB properties, just setting it so we can show in template
-                wrk.answers_formatted = get_completion_code(answers[wrk.worker_id])
-                payoff = participant['payoff_in_real_world_currency']
-                wrk.payoff_plus_participation_fee = payoff + participation_fee
-                wrk.payoff = payoff
-                wrk.finished = participant.get('finished')
-                wrk.code = participant['code']
+
+        workers_by_status = defaultdict(list)
+        auto_rejected_assignment_ids = []
+
+        # auto-reject participants who submitted without clicking the link,
+        # since MTurk will auto-approve them if we don't reject.
+        # this also includes people who tried to participate twice,
+        # since our redirect code won't create an extra HitWorker if there is already
+        # someone with the same worker_id in the session.
+
+        # a single pass over the assignments. the completion codes were already
+        # extracted when the assignments were saved, so no parsing happens here.
+        for a in raw_assignments:
+            # better to refer to oTree DB rather than HR DB, because it's possible for
+            # someone to click the link to oTree HR but maybe the site is down.
+            # otree_pps_by_label is only the people in oTree AND oTree HR
+            participant = otree_pps_by_label.get(a.worker_id)
+            if participant is None:
+                if a.status == 'Submitted':
+                    auto_rejected_assignment_ids.append(a.assignment_id)
+                continue
+            # the ones being rejected will show up as rejected
+            # once their job is done.
+            if a.status == 'Submitted' and a.reject_requested:
+                continue
+            wrk = workers_by_id[a.worker_id]
+            # these are not DB properties, just setting it so we can show in template
+            wrk.answers_formatted = a.completion_code
+            payoff = participant['payoff_in_real_world_currency']
+            wrk.payoff_plus_participation_fee = payoff + participation_fee
+            wrk.payoff = payoff
+            wrk.finished = participant.get('finished')
+            wrk.code = participant['code']
+            workers_by_status[a.status].append(wrk)
+
+        # the rejects happen in the background, so viewing this page doesn't have to wait.
+        # assignments that already have a reject queued are skipped.
+        await sync_to_async(enqueue_rejections)(
+            session,
+            self.profile,
+            auto_rejected_assignment_ids,
+            feedback='Auto-rejecting because this assignment was not found in our database.',
+        )
+
+        workers_approved = workers_by_status['Approved']
+        workers_rejected = workers_by_status['Rejected']
+        workers_not_reviewed = workers_by_status['Submitted']
 
         context = dict(
             workers_approved=workers_approved,
@@ -343,71 +420,83 @@ class MTurkPayments(ExperimenterMixin, SessionMixin, vanilla.TemplateView):
         return self.render_to_response(context)
 
 
-class PayMTurk(ExperimenterMixin, vanilla.View):
+class PayMTurk(AsyncExperimenterMixin, vanilla.View):
     """only POST"""
 
-    def post(self, request, code):
-        session = Session.get_or_404(code=code)
-        successful_payments = 0
-        failed_payments = 0
+    async def post(self, request, code):
+        session = await sync_to_async(Session.get_or_404)(code=code)
         post_data = request.POST
-        mturk_client = get_mturk_client(self.profile, use_sandbox=session.use_sandbox)
         payment_page_response = redirect('ManageHIT', code=session.code)
+        subject = job_subject(session)
+
+        def get_workers():
+            # according to our local copy of the assignments.
+            # this way, resubmitting the form doesn't approve anyone twice.
+            unreviewed_worker_ids = {
+                a.worker_id
+                for a in Assignment.first_per_worker(session)
+                if a.is_unreviewed()
+            }
+            return [
+                wrk
+                for wrk in HITWorker.filter(
+                    worker_id__in=post_data.getlist('workers'), session=session
+                )
+                if wrk.worker_id in unreviewed_worker_ids
+            ]
 
-        workers = HITWorker.filter(
-            worker_id__in=post_data.getlist('workers'), session=session
-        )
+        workers = await sync_to_async(get_workers)()
 
-        site = session.site
-        data = site.call_api(
-            GET,
-            'sessions',
-            session.code,
-            participant_labels=[wrk.worker_id for wrk in workers],
+        site = await sync_to_async(lambda: session.site)()
+        # never pay based on cached payoffs
+        data = await site.aget_session_data(
+            session.code, [wrk.worker_id for wrk in workers], fresh=True
         )
 
         participants_list = data['participants']
         participants = {p['label']: p for p in participants_list}
 
-        for wrk in workers:
-            # need the try/except so that we try to pay the rest of the participants
-
-            payoff = participants[wrk.worker_id]['payoff_in_real_world_currency']
-
-            try:
-                if payoff > 0:
-                    mturk_client.send_bonus(
-                        WorkerId=wrk.worker_id,
-                        AssignmentId=wrk.assignment_id,
-                        BonusAmount='{0:.2f}'.format(Decimal(payoff)),
-                        # prevent duplicate payments
-                        UniqueRequestToken='{}_{}'.format(wrk.id, wrk.assignment_id),
-                        # this field is required.
-                        Reason='Thank you',
-                    )
-                # approve assignment should happen AFTER bonus, so that if bonus fails,
-                # the user will still show up in assignments_not_reviewed.
-                # worst case is that bonus succeeds but approval fails.
-                # in that case, exception will be raised on send_bonus because of UniqueRequestToken.
-                # but that's OK, then you can just unselect that participant and pay the others.
-                mturk_client.approve_assignment(AssignmentId=wrk.assignment_id)
-                successful_payments += 1
-            except Exception as e:
-                msg = (
-                    'Could not pay {} because of an error communicating '
-                    'with MTurk: {}'.format(wrk.worker_id, str(e))
+        payments = [
+            dict(
+                hitworker_id=wrk.id,
+                worker_id=wrk.worker_id,
+                assignment_id=wrk.assignment_id,
+                payoff=participants[wrk.worker_id]['payoff_in_real_world_currency'],
+            )
+            for wrk in workers
+        ]
+
+        def enqueue_payments():
+            # locking the session makes concurrent requests for it take turns,
+            # so that a double-submitted form can't start 2 payment jobs.
+            with transaction.atomic():
+                # a no-op UPDATE rather than select_for_update, which SQLite ignores.
+                # this way SQLite takes its write lock here (waiting for it if needed)
+                # instead of failing when the INSERT below tries to upgrade a read lock.
+                Session.objects.filter(id=session.id).update(id=F('id'))
+                if Job.objects.filter(
+                    name='mturk.pay',
+                    subject=subject,
+                    status__in=[Job.QUEUED, Job.RUNNING],
+                ).exists():
+                    return None
+                # with hundreds of workers, this would take longer than
+                # a web request may take. see mturk.jobs.pay_workers
+                return enqueue(
+                    'mturk.pay',
+                    profile=self.profile,
+                    subject=subject,
+                    description=f'Pay {len(payments)} workers',
+                    session_id=session.id,
+                    payments=payments,
                 )
-                messages.error(request, msg)
-                logger.error(msg)
-                failed_payments += 1
-                if failed_payments > 10:
-                    return payment_page_response
-        msg = 'Successfully made {} payments.'.format(successful_payments)
-        if failed_payments > 0:
-            msg += ' {} payments failed.'.format(failed_payments)
-            messages.warning(request, msg)
-        else:
-            messages.success(request, msg)
+
+        if await sync_to_async(enqueue_payments)() is None:
+            messages.error(request, 'Please wait until the current payments finish.')
+            return payment_page_response
+        messages.success(
+            request, f'Started paying {len(payments)} workers. See the progress below.'
+        )
         return payment_page_response
 
 
@@ -418,20 +507,58 @@ class RejectMTurk(ExperimenterMixin, vanilla.View):
         session = Session.get_or_404(code=code)
         post_data = request.POST
 
-        with MTurkClient(
-            self.profile, use_sandbox=session.use_sandbox, request=request
-        ) as mturk_client:
-            for assignment in HITWorker.filter(
+        assignment_ids = [
+            wrk.assignment_id
+            for wrk in HITWorker.filter(
                 session=session, worker_id__in=post_data.getlist('workers')
-            ):
-                mturk_client.reject_assignment(
-                    AssignmentId=assignment.assignment_id,
-                    # The boto3 docs say this param is optional, but if I omit it, I get:
-                    # An error occurred (ValidationException) when calling the RejectAssignment operation:
-                    # 1 validation error detected: Value null at 'requesterFeedback'
-                    # failed to satisfy constraint: Member must not be null
-                    RequesterFeedback='',
-                )
+            )
+        ]
+        enqueue_rejections(
+            session,
+            self.profile,
+            assignment_ids,
+            # The boto3 docs say this param is optional, but if I omit it, I get:
+            # An error occurred (ValidationException) when calling the RejectAssignment operation:
+            # 1 validation error detected: Value null at 'requesterFeedback'
+            # failed to satisfy constraint: Member must not be null
+            feedback='',
+        )
 
-        messages.success(request, "You successfully rejected " "selected assignments")
+        messages.success(
+            request, "Rejecting the selected assignments. See the progress below."
+        )
         return redirect('ManageHIT', code=code)
+
+
+class MTurkPayoutReport(ExperimenterMixin, SessionMixin, vanilla.View):
+    """Downloads one row per worker with their assignment and payout.
+    Streamed, so that it works for any number of workers.
+    """
+
+    def get(self, request, code):
+        session = self.session
+        assignments = Assignment.objects.filter(assignment_id=OuterRef('assignment_id'))
+        # if a payment was retried, the latest attempt is the one that counts
+        payouts = Payout.objects.filter(hitworker=OuterRef('pk')).order_by('-id')
+        workers = HITWorker.objects.filter(session=session).annotate(
+            assignment_status=Subquery(assignments.values('status')[:1]),
+            completion_code=Subquery(assignments.values('completion_code')[:1]),
+            bonus=Subquery(payouts.values('bonus')[:1]),
+            payout_status=Subquery(payouts.values('status')[:1]),
+            payout_error=Subquery(payouts.values('error')[:1]),
+        )
+        header = [
+            'worker_id',
+            'assignment_id',
+            'assignment_status',
+            'completion_code',
+            'bonus',
+            'payout_status',
+            'payout_error',
+        ]
+        return export_response(
+            request,
+            f'mturk_payouts_{session.code}',
+            header,
+            iter_queryset(workers, *header),
+        )
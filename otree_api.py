@@ -1,11 +1,22 @@
 import requests  # pip3 install requests
 from pprint import pprint
+import requests.adapters
 import requests.exceptions
+import threading
 import urllib.parse
+from os import environ
 
 
-GET = requests.get
-POST = requests.post
+# passed as the "method" arg of call_api
+GET = 'GET'
+POST = 'POST'
+
+# seconds to wait for the TCP/TLS connection, and then for each chunk of the response.
+# without these, a hung oTree site would hang our request (and gunicorn worker) forever.
+CONNECT_TIMEOUT = float(environ.get('OTREE_API_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(environ.get('OTREE_API_READ_TIMEOUT', 30))
+# max number of keep-alive connections we hold open to a single oTree site.
+POOL_SIZE = int(environ.get('OTREE_API_POOL_SIZE', 10))
 
 
 class BaseOTreeApiError(Exception):
@@ -28,11 +39,57 @@ class OTreeServerUnreachable(BaseOTreeApiError):
     pass
 
 
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_http_session(site_url) -> requests.Session:
+    '''one requests.Session per oTree site, shared by all threads in the process,
+    so that consecutive calls reuse the same keep-alive connection
+    instead of doing a new TCP+TLS handshake every time.
+    '''
+    try:
+        return _sessions[site_url]
+    except KeyError:
+        pass
+    with _sessions_lock:
+        if site_url not in _sessions:
+            http = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=POOL_SIZE,
+                # if all connections are in use, wait for one
+                # rather than opening (and discarding) extra ones.
+                pool_block=True,
+            )
+            http.mount('http://', adapter)
+            http.mount('https://', adapter)
+            _sessions[site_url] = http
+        return _sessions[site_url]
+
+
+def close_http_session(site_url):
+    '''when a site is deleted or its URL changes (see hr.signals).
+    only affects this process.
+    '''
+    with _sessions_lock:
+        http = _sessions.pop(site_url, None)
+    if http:
+        http.close()
+
+
 def call_api(site_url, rest_key, method, *path_parts, **params) -> dict:
     path = '/api/' + '/'.join(path_parts)
     url = urllib.parse.urljoin(site_url, path)
+    http = get_http_session(site_url)
     try:
-        resp = method(url, json=params, headers={'otree-rest-key': rest_key})
+        resp = http.request(
+            method,
+            url,
+            json=params,
+            headers={'otree-rest-key': rest_key},
+            timeout=(CONNECT_TIMEOUT, READ_TIMEOUT),
+        )
     except requests.exceptions.RequestException as exc:
         raise OTreeServerUnreachable(f'Could not reach your oTree site at {site_url}')
     if not resp.ok:
@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ProlificConfig(AppConfig):
+    name = 'prolific'
+
+    def ready(self):
+        # make the signals register
+        from . import signals  # noqa
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.7 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('prolific', '0004_merge_20261018_0640'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='session',
+            name='code',
+            field=models.CharField(db_index=True, max_length=255),
+        ),
+    ]
@@ -1,9 +1,12 @@
 import time
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import caches
 from django.db import models
 
 from hr.models import BaseModel, BaseSession
+from hr.write_behind import get_buffer
 
 
 class Session(BaseSession):
@@ -12,6 +15,8 @@ class Session(BaseSession):
         null=True,
         verbose_name="Completion URL",
     )
+    list_fields = BaseSession.list_fields + ['num_participants']
+
     # currently we don't fill this out anywhere (or even need it)
     # study_id = models.CharField(max_length=255, null=True)
 
@@ -26,3 +31,31 @@ class Worker(BaseModel):
     prolific_sid = models.CharField(max_length=255, unique=True)
 
     session: Session = models.ForeignKey(Session, on_delete=models.CASCADE)
+
+    @classmethod
+    def _redirect_cache_key(cls, prolific_sid):
+        return f'prolific_worker:{prolific_sid}'
+
+    @classmethod
+    def record_arrival(cls, session_id, prolific_pid, study_id, prolific_sid):
+        """insert_or_get, but remembers arrivals in-process,
+        so that a participant reloading the link doesn't query the DB again.
+        """
+        cache = caches['redirects']
+        key = cls._redirect_cache_key(prolific_sid)
+        fields = dict(
+            prolific_pid=prolific_pid,
+            study_id=study_id,
+            prolific_sid=prolific_sid,
+            session_id=session_id,
+        )
+        if cache.get(key) != fields:
+            if settings.REDIRECT_WRITE_BEHIND:
+                # prolific_sid is unique, so duplicates are skipped when it's saved.
+                get_buffer(cls).add(cls(**fields))
+            else:
+                cls.insert_or_get(['prolific_sid'], **fields)
+            cache.set(key, fields)
+
+    def clear_redirect_cache(self):
+        caches['redirects'].delete(self._redirect_cache_key(self.prolific_sid))
@@ -0,0 +1,15 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Session, Worker
+
+
+@receiver(post_save, sender=Session)
+@receiver(post_delete, sender=Session)
+def clear_session_redirect_cache(sender, instance, **kwargs):
+    instance.clear_redirect_cache()
+
+
+@receiver(post_save, sender=Worker)
+@receiver(post_delete, sender=Worker)
+def clear_worker_redirect_cache(sender, instance, **kwargs):
+    instance.clear_redirect_cache()
@@ -1,14 +1,18 @@
 import json
 import logging
+from typing import List
 
 import vanilla
+from asgiref.sync import sync_to_async
 from django.contrib import messages
 from django.http import HttpResponseRedirect
 from django.shortcuts import redirect, get_object_or_404
 from django.urls import reverse
 
+from hr import metrics
+from hr.export import export_response
 from hr.models import Site
-from hr.views import ExperimenterMixin
+from hr.views import ExperimenterMixin, AsyncExperimenterMixin
 from otree_api import GET, POST
 from .models import Session, Worker
 
@@ -17,19 +21,22 @@ logger = logging.getLogger(__name__)
 
 class RedirectProlific(vanilla.View):
     def get(self, request, id):
-        session = Session.get_or_404(id=id)
+        # see Session.get_session_wide_url and Worker.record_arrival.
+        # participants who reload the link don't cause any DB queries.
+        session_wide_url = Session.get_session_wide_url(id)
 
         prolific_pid = request.GET['PROLIFIC_PID']
         prolific_sid = request.GET['SESSION_ID']
         study_id = request.GET['STUDY_ID']
-        Worker.objects.get_or_create(
+        Worker.record_arrival(
+            session_id=id,
             prolific_pid=prolific_pid,
             study_id=study_id,
             prolific_sid=prolific_sid,
-            session=session,
         )
+        metrics.redirects.inc(app='prolific')
         return HttpResponseRedirect(
-            session.session_wide_url + '?participant_label=' + prolific_pid
+            session_wide_url + '?participant_label=' + prolific_pid
         )
 
 
@@ -41,8 +48,15 @@ class ProlificSessions(ExperimenterMixin, vanilla.CreateView):
     def get_context_data(self, **kwargs):
         site_id = self.kwargs['site_id']
         site = Site.get_or_404(id=site_id, profile=self.profile)
-        sessions = Session.objects.filter(site_id=site_id).order_by('-id')
-        return dict(sessions=sessions, site=site)
+        before = self.request.GET.get('before', '')
+        before_id = int(before) if before.isdigit() else None
+        sessions, next_before_id = Session.page_for_site(site_id, before_id=before_id)
+        return dict(
+            sessions=sessions,
+            site=site,
+            next_before_id=next_before_id,
+            is_first_page=before_id is None,
+        )
 
     def post(self, request, site_id):
         site = get_object_or_404(Site, id=site_id, profile=self.profile)
@@ -113,23 +127,23 @@ class ProlificSession(SessionMixin, ExperimenterMixin, vanilla.UpdateView):
         return redirect('ProlificSession', session.code)
 
 
-class ProlificPayments(ExperimenterMixin, SessionMixin, vanilla.TemplateView):
+class ProlificPayments(AsyncExperimenterMixin, vanilla.TemplateView):
     template_name = 'prolific/ProlificPayments.html'
 
-    def get_context_data(self, **kwargs):
-        session = self.session
-        site = session.site
+    async def get(self, request, code):
+        context = await self.get_context_data(code)
+        return self.render_to_response(context)
 
-        data = site.call_api(GET, 'sessions', session.code)
+    async def get_context_data(self, code):
+        session = await sync_to_async(Session.get_or_404)(code=code)
+        site = await sync_to_async(lambda: session.site)()
 
-        unfiltered_participants = data['participants']
+        data = await site.aget_session_data(
+            session.code, fresh='refresh' in self.request.GET
+        )
 
         try:
-            participants = [
-                (pp['label'], pp['payoff_in_real_world_currency'])
-                for pp in unfiltered_participants
-                if pp['finished'] and pp['payoff_in_real_world_currency'] > 0
-            ]
+            participants = list(iter_bonus_rows(data['participants']))
         except KeyError:
             msg = (
                 "you need to add 'finished' to PARTICIPANT_FIELDS and " "(oTree 5 only)"
@@ -137,6 +151,42 @@ class ProlificPayments(ExperimenterMixin, SessionMixin, vanilla.TemplateView):
             messages.error(self.request, msg)
             return dict(participants=[], session=session)
 
-        textarea = '\n'.join(f'{tup[0]},{tup[1]}' for tup in participants)
+        # a huge textarea makes the page slow, so then we only offer the download.
+        if len(participants) <= TEXTAREA_MAX_ROWS:
+            textarea = '\n'.join(f'{tup[0]},{tup[1]}' for tup in participants)
+        else:
+            textarea = None
 
         return dict(participants=participants, session=session, textarea=textarea)
+
+
+# above this, ProlificPayments only links to ProlificBonusExport
+TEXTAREA_MAX_ROWS = 500
+
+
+def iter_bonus_rows(participants: List[dict]):
+    for pp in participants:
+        if pp['finished'] and pp['payoff_in_real_world_currency'] > 0:
+            yield pp['label'], pp['payoff_in_real_world_currency']
+
+
+class ProlificBonusExport(ExperimenterMixin, SessionMixin, vanilla.View):
+    """The bulk bonus list as a file, in the format Prolific expects
+    (participant ID and amount, without a header).
+    """
+
+    def get(self, request, code):
+        session = self.session
+        # people pay from this file, so never from cached payoffs
+        data = session.site.get_session_data(session.code, fresh=True)
+        participants = data['participants']
+        # check now, because once the download has started we can't show an error
+        if participants and 'finished' not in participants[0]:
+            return redirect('ProlificPayments', code=session.code)
+        return export_response(
+            request,
+            f'prolific_bonuses_{session.code}',
+            ['participant_id', 'amount'],
+            iter_bonus_rows(participants),
+            csv_header=False,
+        )